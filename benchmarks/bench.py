@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+'''htmlarticle 基准测试
+
+   使用 corpus.py 中的语料，分别统计 Article.preprocess()、Article.article()（不同的rows）、
+   图片转换为inline image 各阶段的耗时及内存峰值，可以保存为基准数据，并与之前保存的基准数据比较。
+   图片从本地临时目录中通过file://地址读取，整个测试不访问网络。
+
+   运行方法：
+       python3 benchmarks/bench.py                          运行全部语料
+       python3 benchmarks/bench.py --quick                  只运行较小的语料
+       python3 benchmarks/bench.py -k article               只运行名称中包含article的语料
+       python3 benchmarks/bench.py --save baseline.json     保存基准数据
+       python3 benchmarks/bench.py --compare baseline.json  与基准数据比较，有性能退化时返回值为1
+
+   参数说明：
+       -n <次数>               每个阶段运行的次数，默认为3
+       -k <名称>               只运行名称中包含此字符串的语料
+       --quick                 只运行小于1MB的语料
+       --save <file>           将结果保存为基准数据（json）
+       --compare <file>        与--save保存的基准数据比较，耗时或内存峰值超过基准数据的(1 + tolerance)倍时为性能退化
+       --tolerance <比例>      允许的增长比例，默认为0.25
+       --parser <name>         使用的html解析器，默认为html.parser
+
+   耗时与机器有关，仓库中不保存基准数据。比较之前先在同一台机器上、修改之前的代码上使用相同的参数保存基准数据，例如：
+       git stash
+       python3 benchmarks/bench.py --quick --save /tmp/baseline.json
+       git stash pop
+       python3 benchmarks/bench.py --quick --compare /tmp/baseline.json'''
+
+import os
+import os.path
+import sys
+import time
+import json
+import getopt
+import tempfile
+import tracemalloc
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "pyxygen"))
+
+import htmlarticle
+import corpus
+
+
+# 统计字数时使用的rows，用于比较rows对耗时的影响
+sweepRows = [3, 10, 30]
+
+# 小于此大小的语料在--quick模式下运行
+quickSize = 1024 * 1024
+
+
+def createImages(dirname, number, size = 20 * 1024):
+    ''' 在dirname/images目录中生成number个图片文件，文件名与corpus.py中的img标签对应 '''
+    d = os.path.join(dirname, "images")
+    os.makedirs(d, exist_ok = True)
+    for i in range(number):
+        with open(os.path.join(d, "{}.jpg".format(i)), mode = 'wb') as f:
+            f.write(os.urandom(size))
+
+
+def phases(html, baseurl, parser):
+    ''' 返回要测试的阶段，为(名称, 准备函数, 测试函数)列表
+        准备函数返回测试函数的参数，准备函数的耗时不计入统计
+    '''
+    def prepared(**kwargs):
+        article = htmlarticle.Article(html = html, url = baseurl, parser = parser, **kwargs)
+        article.preprocess()
+        return article
+
+    result = [("preprocess",
+        lambda: htmlarticle.Article(html = html, url = baseurl, parser = parser),
+        lambda article: article.preprocess())]
+
+    for rows in sweepRows:
+        result.append(("article(rows={})".format(rows),
+            lambda rows = rows: prepared(rows = rows, iimage = False),
+            lambda article: article.article()))
+
+    if "<img" in html:
+        result.append(("article(inline)",
+            lambda: prepared(iimage = True),
+            lambda article: article.article()))
+
+    return result
+
+
+def measure(setup, func, number):
+    ''' 返回(最短耗时（秒）, 内存峰值（字节）)，内存峰值单独运行一次进行统计 '''
+    best = None
+    for _ in range(number):
+        arg = setup()
+        t = time.perf_counter()
+        func(arg)
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+
+    arg = setup()
+    tracemalloc.start()
+    func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (best, peak)
+
+
+def run(cases, number, parser):
+    ''' 运行基准测试，返回 {语料名称: {阶段: {"seconds": 耗时, "peak": 内存峰值, "bytes": 语料大小}}} '''
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        createImages(tmp, 60)
+        baseurl = urllib.parse.urljoin("file:", urllib.request.pathname2url(tmp) + "/article.html")
+
+        print("{:<28}{:<18}{:>12}{:>14}".format("corpus", "phase", "time", "peak memory"))
+        for name, html in cases:
+            results[name] = dict()
+            size = len(html.encode('utf-8'))
+            for phase, setup, func in phases(html, baseurl, parser):
+                seconds, peak = measure(setup, func, number)
+                results[name][phase] = {"seconds": seconds, "peak": peak, "bytes": size}
+                print("{:<28}{:<18}{:>10.1f}ms{:>12.1f}MB".format(name, phase, seconds * 1000, peak / 1024 / 1024))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    ''' 与基准数据比较，返回性能退化的条目列表 '''
+    regressions = []
+    for name, items in results.items():
+        for phase, current in items.items():
+            old = baseline.get(name, dict()).get(phase)
+            if old is None:
+                continue
+            for key in ["seconds", "peak"]:
+                if old[key] > 0 and current[key] > old[key] * (1 + tolerance):
+                    regressions.append("{} {} {}: {:.4g} -> {:.4g} (+{:.0%})".format(
+                        name, phase, key, old[key], current[key], current[key] / old[key] - 1))
+    return regressions
+
+
+if __name__ == '__main__':
+
+    number = 3
+    quick = False
+    save = None
+    baselineFile = None
+    tolerance = 0.25
+    parser = "html.parser"
+    only = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:k:",
+                ["quick", "save=", "compare=", "tolerance=", "parser="])
+    except getopt.GetoptError:
+        sys.exit(__doc__)
+
+    for i, j in opts:
+        if i == "-n":
+            number = int(j)
+        elif i == "-k":
+            only = j
+        elif i == "--quick":
+            quick = True
+        elif i == "--save":
+            save = j
+        elif i == "--compare":
+            baselineFile = j
+        elif i == "--tolerance":
+            tolerance = float(j)
+        elif i == "--parser":
+            parser = htmlarticle.checkParser(j)
+
+    # 运行之前先读取基准数据，文件不存在时不必等待运行结束
+    baseline = None
+    if baselineFile is not None:
+        try:
+            with open(baselineFile) as f:
+                baseline = json.load(f)
+        except IOError as e:
+            sys.exit("无法读取基准数据：{}，请先使用--save参数保存基准数据".format(e.filename))
+
+    cases = corpus.fullCorpus()
+    if quick:
+        cases = [(name, html) for name, html in cases if len(html.encode('utf-8')) < quickSize]
+    if only is not None:
+        cases = [(name, html) for name, html in cases if only in name]
+
+    results = run(cases, number, parser)
+
+    if save is not None:
+        with open(save, mode = 'wt') as f:
+            json.dump(results, f, indent = 1)
+        print("基准数据已保存：{}".format(save))
+
+    if baselineFile is not None:
+        regressions = compare(results, baseline, tolerance)
+        if regressions:
+            print("性能退化（超过{:.0%}）：".format(tolerance))
+            for r in regressions:
+                print("    " + r)
+            sys.exit(1)
+        print("与基准数据相比没有性能退化")
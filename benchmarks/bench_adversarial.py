@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+'''使用生成的恶意网页检查htmlarticle.py中在整个网页上查找标签的函数，确保耗时与网页大小成正比
+
+   未闭合的注释、pre标签，没有>的<img、<body，超长的属性等网页会使.*?等正则表达式的匹配从每个起点重新扫描到结尾，
+   耗时与网页大小的平方成正比，一个网页就可以使批量处理、服务模式的工作进程长时间无响应。
+
+   每个网页用例生成两种大小（size、size×4），在单独的子进程中运行以下检查对象，记录耗时：
+       comments        removeHtmlComments()
+       pre2p           pre2p()
+       body            hasBodyTag()
+       img             findImgTags()
+       links           absoluteLinks()
+       article         Article.preprocess()及article()，lines、dom两种引擎
+
+   以下情况输出FAIL，有用例失败时返回值为1：
+       子进程运行超过时间限制（--limit），例如出现了耗时与网页大小的平方成正比的处理
+       网页大小为size×4时的耗时超过预算（每KB的毫秒数，见cases）
+       耗时增长超过大小增长的2倍，即size×4的耗时超过size的耗时的8倍（耗时较短时不检查）
+       comments、pre2p、body、img的结果与原来使用的正则表达式不同（在较小的网页上比较）
+
+   运行方法：python3 benchmarks/bench_adversarial.py [--size <KB>] [--limit <秒>] [--scale <倍数>] [--parser <name>]
+
+   参数说明：
+       --size <KB>         生成的网页的大小，默认为50KB
+       --limit <秒>        每个子进程的时间限制，默认为60秒
+       --scale <倍数>      将所有耗时预算及时间限制乘以此倍数，在较慢的机器上运行时使用，默认为1
+       --parser <name>     使用的html解析器，默认使用可用的最快的解析器。
+                           html5lib构建解析树时对大量嵌套的标签（pre用例）本身的耗时与嵌套层数的平方成正比，
+                           使用html5lib时pre用例的article检查会失败，这种网页应使用lxml或html.parser处理'''
+
+import os.path
+import sys
+import re
+import html
+import json
+import time
+import getopt
+import subprocess
+
+srcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "pyxygen")
+
+# (名称, 说明, 生成网页的恶意部分，参数为字符数)
+pages = [
+    ("comments", "大量未闭合的注释", lambda n: "<!--x" * (n // 5)),
+    ("pre", "大量嵌套且未闭合的pre标签", lambda n: "<pre>x" * (n // 6)),
+    ("preopen", "大量没有>的<pre", lambda n: "<pre x" * (n // 6)),
+    ("body", "大量没有>的<body", lambda n: "<body x" * (n // 7)),
+    ("img", "大量没有>的<img", lambda n: "<img x" * (n // 6)),
+    ("imgsrc", "一个没有>的img标签中有大量src属性", lambda n: "<img" + ' src="a.png"' * (n // 12)),
+    ("lt", "大量没有>的<", lambda n: '<a href="x"' + "<" * n),
+    ("attr", "超长的属性值", lambda n: '<p><img alt="' + "x" * n + '" src="a.png"></p>'),
+    ("attrs", "一个标签中有大量属性", lambda n: "<p><img" + "".join(' a{}="x"'.format(i) for i in range(n // 10)) +
+        ' src="a.png"></p>'),
+]
+
+# (检查对象, 网页为size×4时每KB的耗时预算（毫秒）)
+cases = [
+    ("comments", 0.5),
+    ("pre2p", 0.5),
+    ("body", 0.5),
+    ("img", 0.5),
+    ("links", 2),
+    ("article", 50),
+]
+
+# 耗时少于此值（秒）时不检查耗时增长，避免计时误差
+growthMinimum = 0.02
+
+
+def makePage(name, size):
+    ''' 生成名称为name的网页，正文之后是恶意部分 '''
+    generate = [page[2] for page in pages if page[0] == name][0]
+    return "<p>这是网页的正文内容。</p>" + generate(size)
+
+
+def references():
+    ''' 返回原来使用的正则表达式实现，用于比较结果 '''
+
+    import htmlarticle
+
+    def pre2p(s):
+        def repl(match):
+            return "<p>" + "<br />".join(html.escape(match.group(1).strip()).splitlines()) + "</p>"
+        return re.sub(r"<pre[^>]*>(.*?)</pre>", repl, s, flags = re.IGNORECASE | re.DOTALL)
+
+    return {
+        "comments": lambda s: re.sub("<!--.*?-->", "", s, flags = re.DOTALL),
+        "pre2p": pre2p,
+        "body": lambda s: re.search("<body[^>]*>(.*)</body>", s, flags = re.IGNORECASE | re.DOTALL) is not None,
+        "img": lambda s: [(m.span(), m.groups()) for m in htmlarticle._imgPattern.finditer(s)],
+    }
+
+
+def targets(parser):
+    ''' 返回检查对象，名称 -> 函数，参数为网页 '''
+
+    import htmlarticle
+
+    def article(s):
+        for engine in htmlarticle.engines:
+            a = htmlarticle.Article(html = s, url = "http://example.com/1.html", iimage = False, parser = parser,
+                engine = engine)
+            try:
+                a.preprocess()
+                a.article()
+            except ValueError:
+                # 恶意部分被清理后body可能为空
+                pass
+
+    return {
+        "comments": htmlarticle.removeHtmlComments,
+        "pre2p": htmlarticle.pre2p,
+        "body": htmlarticle.hasBodyTag,
+        "img": lambda s: [(m.span(), m.groups()) for m in htmlarticle.findImgTags(s)],
+        "links": lambda s: htmlarticle.absoluteLinks(s, "http://example.com/a/"),
+        "article": article,
+    }
+
+
+def child(name, size, parser):
+    ''' 在子进程中对一个网页运行所有检查对象，输出json：检查对象 -> 耗时（秒），
+        size为0时改为在较小的网页上与原来的正则表达式比较结果，输出json：不相同的检查对象列表
+    '''
+
+    sys.path.insert(0, srcdir)
+    functions = targets(parser)
+
+    if size == 0:
+        different = []
+        for key, reference in references().items():
+            for n in [0, 1, 7, 64, 1000]:
+                s = makePage(name, n)
+                if functions[key](s) != reference(s):
+                    different.append(key)
+                    break
+        print(json.dumps(different))
+        return
+
+    # 预热，bs4等模块在第一次提取正文时才导入
+    functions["article"](makePage(name, 0))
+
+    s = makePage(name, size)
+    result = dict()
+    for key, _ in cases:
+        t = time.perf_counter()
+        functions[key](s)
+        result[key] = time.perf_counter() - t
+    print(json.dumps(result))
+
+
+def run(name, size, parser, limit):
+    ''' 在子进程中运行child()，返回其输出，超过时间限制时返回None '''
+
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--size", str(size)]
+    if parser is not None:
+        command += ["--parser", parser]
+    try:
+        proc = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE, timeout = limit)
+    except subprocess.TimeoutExpired:
+        return None
+    if proc.returncode != 0:
+        sys.exit("运行失败：{}\n{}".format(name, proc.stderr.decode('utf-8', 'replace')))
+    return json.loads(proc.stdout)
+
+
+if __name__ == '__main__':
+
+    size = 50
+    limit = 60.0
+    scale = 1.0
+    parser = None
+    childPage = None
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["size=", "limit=", "scale=", "parser=", "child="])
+        for i, j in opts:
+            if i == "--size":
+                size = int(j)
+            elif i == "--limit":
+                limit = float(j)
+            elif i == "--scale":
+                scale = float(j)
+            elif i == "--parser":
+                parser = j
+            elif i == "--child":
+                childPage = j
+    except (getopt.GetoptError, ValueError):
+        sys.exit("参数输入错误")
+
+    if childPage is not None:
+        # 子进程中size为字符数
+        child(childPage, size, parser)
+        sys.exit()
+
+    failed = 0
+    print("{:<10}{:<10}{:>10}{:>10}{:>8}{:>10}  {}".format("page", "target", "ms", "ms x4", "growth", "budget",
+        "result"))
+    for name, description, _ in pages:
+        small = run(name, size * 1024, parser, limit * scale)
+        large = run(name, size * 4096, parser, limit * scale)
+        different = run(name, 0, parser, limit * scale)
+        if small is None or large is None or different is None:
+            failed += 1
+            print("{:<10}{:<10}{:>10}{:>10}{:>8}{:>10}  FAIL 超过时间限制（{}）".format(name, "-", "-", "-", "-", "-",
+                description))
+            continue
+        for key, budget in cases:
+            limitMs = budget * size * 4 * scale
+            problems = []
+            if large[key] * 1000 > limitMs:
+                problems.append("超过预算")
+            growth = large[key] / small[key] if small[key] > 0 else 0.0
+            if large[key] >= growthMinimum * scale and growth > 8:
+                problems.append("耗时增长过快")
+            if key in different:
+                problems.append("结果与原来的正则表达式不同")
+            if problems:
+                failed += 1
+            print("{:<10}{:<10}{:>10.1f}{:>10.1f}{:>8.1f}{:>10.0f}  {}".format(name, key, small[key] * 1000,
+                large[key] * 1000, growth, limitMs,
+                "FAIL " + "；".join(problems) + "（{}）".format(description) if problems else "ok"))
+
+    if failed > 0:
+        sys.exit(1)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+'''比较htmlarticle.Article的两种正文提取引擎（lines、dom）的速度及提取结果
+
+   对生成的网页（正文前后有导航、侧栏、相关文章、评论等内容）分别使用两种引擎提取正文，
+   输出预处理及生成正文的耗时（取最快一次），以及与已知正文相比的准确率、召回率，两种引擎结果的一致程度。
+   每个网页有格式化（每个段落一行）和压缩（整个网页只有一行）两种版本，lines引擎依赖换行，结果只输出数据用于对比；
+   dom引擎的准确率、召回率低于下限时输出FAIL，有用例失败时返回值为1。
+
+   文字按照正文中的文本块（get_text()按换行拆分后的每一行）比较：
+       precision       提取结果中属于正文的文本块所占比例
+       recall          正文中被提取出来的文本块所占比例
+       agree           两种引擎提取的文本块的Jaccard相似度（交集/并集）
+
+   运行方法：python3 benchmarks/bench_engines.py [-n <次数>] [--paragraphs <段数>] [文件]...
+
+   参数说明：
+       -n <次数>               每个用例运行的次数，默认为5
+       --paragraphs <段数>     生成的网页的正文段数，默认为200
+       --min <比例>            dom引擎准确率、召回率的下限，默认为0.95
+       --parser <name>         使用的html解析器，默认使用可用的最快的解析器
+       文件                    额外比较的本地html文件，没有已知正文，只输出耗时及两种引擎的一致程度'''
+
+import os.path
+import sys
+import time
+import getopt
+
+srcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "pyxygen")
+sys.path.insert(0, srcdir)
+
+import htmlarticle
+
+
+def makePage(paragraphs):
+    ''' 生成一个网页，返回(格式化的html, 正文中的文本块)，正文段落中含有少量链接及加粗文字 '''
+
+    content = ["<h1>文章标题</h1>"]
+    for i in range(paragraphs):
+        text = "这是一段用于测试的正文内容，" * (3 + i % 5)
+        content.append('<p class="text"><b>第{}段</b>{}参见<a href="/ref/{}">链接{}</a>。</p>'.format(i, text, i, i))
+        if i % 20 == 10:
+            content.append('<p><img src="/img/{}.jpg" alt=""></p>'.format(i))
+
+    nav = "\n".join('<li><a href="/c/{0}">栏目{0}</a></li>'.format(i) for i in range(30))
+    side = "\n".join('<li><a href="/hot/{0}">热门文章{0}：一个比较长的标题</a></li>'.format(i) for i in range(40))
+    related = "\n".join('<li><a href="/r/{0}">相关文章{0}</a> <span>2020-01-01</span></li>'.format(i) for i in range(20))
+    comments = "\n".join('<div class="comment"><div class="user"><a href="/u/{0}">用户{0}</a></div>'
+        '<div class="text">评论{0}：写得不错</div></div>'.format(i) for i in range(30))
+    html = ('<!DOCTYPE html>\n<html>\n<head>\n<title>文章标题</title>\n<script>var x = 1;</script>\n</head>\n<body>\n'
+        '<div id="top"><ul>\n{}\n</ul></div>\n'
+        '<div id="wrap">\n<div id="side"><h3>热门</h3><ul>\n{}\n</ul></div>\n'
+        '<div id="main">\n<div class="article">\n{}\n</div>\n'
+        '<div class="related"><h3>相关文章</h3><ul>\n{}\n</ul></div>\n'
+        '<div class="comments">\n{}\n</div>\n</div>\n</div>\n'
+        '<div id="bottom"><a href="/about">关于我们</a> | <a href="/contact">联系我们</a></div>\n'
+        '</body>\n</html>\n').format(nav, side, "\n".join(content), related, comments)
+    return (html, textBlocks("".join(content)))
+
+
+def minify(html):
+    ''' 去掉所有换行，相当于压缩过的网页 '''
+    return html.replace("\n", "")
+
+
+def textBlocks(html):
+    ''' 返回html中的文本块集合 '''
+    from bs4 import BeautifulSoup
+    text = BeautifulSoup(html, "html.parser").get_text("\n")
+    return set(line.strip() for line in text.splitlines() if line.strip() != "")
+
+
+def extract(html, engine, parser, number):
+    ''' 运行number次，返回(最快一次的耗时（秒）, 提取的文本块) '''
+    best = None
+    result = ""
+    for _ in range(number):
+        t = time.perf_counter()
+        article = htmlarticle.Article(html = html, url = "http://example.com/1.html", iimage = False,
+            withTitle = False, withSource = False, parser = parser, engine = engine)
+        article.preprocess()
+        result = article.article()
+        elapsed = time.perf_counter() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    return (best, textBlocks(result))
+
+
+def ratio(a, b):
+    return a / b if b > 0 else 1.0
+
+
+if __name__ == '__main__':
+
+    number = 5
+    paragraphs = 200
+    minimum = 0.95
+    parser = None
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:", ["paragraphs=", "min=", "parser="])
+        for i, j in opts:
+            if i == "-n":
+                number = int(j)
+            elif i == "--paragraphs":
+                paragraphs = int(j)
+            elif i == "--min":
+                minimum = float(j)
+            elif i == "--parser":
+                parser = j
+    except (getopt.GetoptError, ValueError):
+        sys.exit("参数输入错误")
+
+    html, truth = makePage(paragraphs)
+    # (名称, html, 已知正文的文本块，为None时只比较两种引擎)
+    cases = [("formatted", html, truth), ("minified", minify(html), truth)]
+    for filename in args:
+        with open(filename, encoding = 'utf-8', errors = 'replace') as f:
+            cases.append((os.path.basename(filename), f.read(), None))
+
+    failed = 0
+    print("{:<16}{:<8}{:>10}{:>11}{:>8}{:>8}  {}".format("case", "engine", "ms", "precision", "recall", "agree",
+        "result"))
+    for name, html, truth in cases:
+        results = dict((engine, extract(html, engine, parser, number)) for engine in htmlarticle.engines)
+        lines = results["lines"][1]
+        dom = results["dom"][1]
+        agree = ratio(len(lines & dom), len(lines | dom))
+        for engine in htmlarticle.engines:
+            elapsed, blocks = results[engine]
+            if truth is None:
+                print("{:<16}{:<8}{:>8.1f}ms{:>11}{:>8}{:>8.2f}  -".format(name, engine, elapsed * 1000, "-", "-",
+                    agree))
+                continue
+            precision = ratio(len(blocks & truth), len(blocks))
+            recall = ratio(len(blocks & truth), len(truth))
+            result = "-"
+            if engine == "dom":
+                result = "ok" if precision >= minimum and recall >= minimum else "FAIL"
+                if result != "ok":
+                    failed += 1
+            print("{:<16}{:<8}{:>8.1f}ms{:>11.2f}{:>8.2f}{:>8.2f}  {}".format(name, engine, elapsed * 1000,
+                precision, recall, agree, result))
+
+    if failed > 0:
+        sys.exit(1)
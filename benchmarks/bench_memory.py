@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+'''检查批量处理大量网页时htmlarticle.Article的内存占用
+
+   每个用例在单独的子进程中运行：依次处理若干个生成的大网页，每处理一批记录一次进程的内存峰值（ru_maxrss）。
+   预热阶段（前1/5的网页）之后内存峰值的增长超过预算时输出FAIL，有用例失败时返回值为1。
+
+   用例说明：
+       discard         处理完即丢弃Article对象，相当于批量处理及html2epub.py的用法，内存峰值应当保持不变
+       discard-low     同上，使用低内存模式（lowMemory = True）
+       retain          保留所有Article对象，每个对象保留原始html及body，只输出数据用于对比，不检查预算
+       retain-low      保留所有Article对象（低内存模式），每个对象只保留正文所需的body，增长应与正文大小相当
+
+   运行方法：python3 benchmarks/bench_memory.py [-n <网页数>] [--size <KB>] [--scale <倍数>]
+
+   参数说明：
+       -n <网页数>         每个用例处理的网页数，默认为100
+       --size <KB>         每个网页的大小，默认为500KB
+       --scale <倍数>      将所有内存预算乘以此倍数，默认为1
+       --parser <name>     使用的html解析器，默认使用可用的最快的解析器
+
+   只能在提供resource模块的系统（Linux、macOS等）上运行。'''
+
+import os.path
+import sys
+import json
+import getopt
+import subprocess
+
+srcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "pyxygen")
+
+# (名称, 是否使用低内存模式, 是否保留Article对象, 预热后内存峰值增长的预算（MB）)
+# 预算为"body"时按照保留的正文大小估算，见budget()；为None时不检查
+cases = [
+    ("discard", False, False, 30),
+    ("discard-low", True, False, 20),
+    ("retain", False, True, None),
+    ("retain-low", True, True, "body"),
+]
+
+
+def makePage(index, size):
+    ''' 生成一个约size字节的网页，正文前后有导航、脚本等需要清理的内容，每个网页的内容不同 '''
+
+    nav = "".join('<li><a href="/c/{0}">栏目{0}</a></li>'.format(i) for i in range(50))
+    script = "<script>var data = [{}];</script>".format(",".join(str(i) for i in range(500)))
+    paragraph = '<p class="text" style="margin:0">第{}篇文章的第{}段，' + "正文内容" * 30 + "</p>\n"
+    body = []
+    length = 0
+    while length < size:
+        body.append(paragraph.format(index, len(body)))
+        length += len(body[-1].encode('utf-8'))
+    return ('<!DOCTYPE html><html><head><title>文章{0}</title>{1}</head><body><nav><ul>{2}</ul></nav>'
+        '<div id="main"><h1>文章{0}</h1>{3}</div><footer><ul>{2}</ul></footer></body></html>').format(
+        index, script, nav, "".join(body))
+
+
+def child(lowMemory, retain, number, size, parser):
+    ''' 在子进程中运行一个用例，输出json：每处理一批网页后的内存峰值（KB）及保留的body的字符数 '''
+
+    import resource
+    sys.path.insert(0, srcdir)
+    import htmlarticle
+
+    # ru_maxrss在Linux上的单位为KB，在macOS上为字节
+    unit = 1024 if sys.platform == "darwin" else 1
+    retained = []
+    samples = []
+    bodyChars = 0
+    step = max(1, number // 10)
+    for i in range(number):
+        article = htmlarticle.Article(html = makePage(i, size), url = "http://example.com/{}.html".format(i),
+            iimage = False, parser = parser, lowMemory = lowMemory)
+        article.preprocess()
+        html = article.article()
+        bodyChars += len(html)
+        if retain:
+            retained.append(article)
+        del article, html
+        if (i + 1) % step == 0:
+            samples.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // unit)
+    print(json.dumps({"samples": samples, "chars": bodyChars}))
+
+
+def budget(base, chars):
+    ''' 返回用例的内存预算（MB），base为"body"时按保留的正文估算：每个字符2字节（str中的汉字）再加20MB '''
+
+    if base != "body":
+        return base
+    return chars * 2 / 1024 / 1024 + 20
+
+
+if __name__ == '__main__':
+
+    number = 100
+    size = 500
+    scale = 1.0
+    parser = None
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:", ["size=", "scale=", "parser=", "child="])
+        childCase = None
+        for i, j in opts:
+            if i == "-n":
+                number = int(j)
+            elif i == "--size":
+                size = int(j)
+            elif i == "--scale":
+                scale = float(j)
+            elif i == "--parser":
+                parser = j
+            elif i == "--child":
+                childCase = j
+    except (getopt.GetoptError, ValueError):
+        sys.exit("参数输入错误")
+
+    try:
+        import resource
+    except ImportError:
+        sys.exit("当前系统没有resource模块，无法统计内存峰值")
+
+    if childCase is not None:
+        _, lowMemory, retain, _ = [case for case in cases if case[0] == childCase][0]
+        child(lowMemory, retain, number, size * 1024, parser)
+        sys.exit()
+
+    failed = 0
+    print("{:<14}{:>10}{:>10}{:>10}{:>10}  {}".format("case", "warm MB", "end MB", "growth", "budget", "result"))
+    for name, lowMemory, retain, base in cases:
+        command = [sys.executable, os.path.abspath(__file__), "--child", name, "-n", str(number), "--size", str(size)]
+        if parser is not None:
+            command += ["--parser", parser]
+        proc = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+        if proc.returncode != 0:
+            sys.exit("运行失败：{}\n{}".format(name, proc.stderr.decode('utf-8', 'replace')))
+        result = json.loads(proc.stdout)
+        samples = result["samples"]
+        # 前1/5的网页作为预热阶段
+        warm = samples[max(0, len(samples) // 5 - 1)] / 1024
+        end = samples[-1] / 1024
+        if base is None:
+            print("{:<14}{:>10.1f}{:>10.1f}{:>10.1f}{:>10}  -".format(name, warm, end, end - warm, "-"))
+            continue
+        limit = budget(base, result["chars"]) * scale
+        ok = end - warm <= limit
+        if not ok:
+            failed += 1
+        print("{:<14}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}  {}".format(name, warm, end, end - warm, limit,
+            "ok" if ok else "FAIL"))
+
+    if failed > 0:
+        sys.exit(1)
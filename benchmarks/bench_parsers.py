@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+'''比较不同html解析器下 Article.preprocess() 和 Article.article() 的耗时
+
+   运行方法：python3 benchmarks/bench_parsers.py [-n <次数>]'''
+
+import os.path
+import sys
+import time
+import getopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "pyxygen"))
+
+import htmlarticle
+import corpus
+
+
+def bench(html, parser, number):
+    ''' 返回number次运行中最快的一次的耗时（秒）：(preprocess, article) '''
+    best = None
+    for _ in range(number):
+        article = htmlarticle.Article(html = html, url = "http://www.example.com/", iimage = False, parser = parser)
+        t0 = time.perf_counter()
+        article.preprocess()
+        t1 = time.perf_counter()
+        article.article()
+        t2 = time.perf_counter()
+        if best is None or t2 - t0 < sum(best):
+            best = (t1 - t0, t2 - t1)
+    return best
+
+
+if __name__ == '__main__':
+
+    number = 3
+    opts, args = getopt.getopt(sys.argv[1:], "n:")
+    for i, j in opts:
+        if i == "-n":
+            number = int(j)
+
+    print("{:<8}{:<14}{:>14}{:>14}".format("page", "parser", "preprocess", "article"))
+    for name, html in corpus.fixedCorpus():
+        for parser in htmlarticle.availableParsers():
+            pre, art = bench(html, parser, number)
+            print("{:<8}{:<14}{:>12.1f}ms{:>12.1f}ms".format(name, parser, pre * 1000, art * 1000))
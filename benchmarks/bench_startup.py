@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+'''检查htmlarticle.py、html2epub.py、passgen.py的启动耗时及启动时导入的模块
+
+   每个用例使用 python -X importtime 运行若干次，取最快一次的耗时减去空解释器的启动耗时，
+   超过预算或导入了不应导入的模块时输出FAIL，有用例失败时返回值为1，可以在提交代码前运行。
+
+   命令行工具通常作为脚本运行，python每次都要编译整个文件，htmlarticle.py的编译约需几十毫秒，
+   因此既检查作为脚本运行（script）的耗时，也检查使用-m运行（读取__pycache__中编译好的文件）的耗时，
+   后者不受编译耗时的影响，可以更准确地发现启动时导入的模块的变化。运行前先编译src/pyxygen中的文件。
+
+   运行方法：python3 benchmarks/bench_startup.py [-n <次数>] [--scale <倍数>]
+
+   参数说明：
+       -n <次数>           每个用例运行的次数，默认为10
+       --scale <倍数>      将所有耗时预算乘以此倍数，在较慢的机器上运行时使用，默认为1'''
+
+import os.path
+import sys
+import time
+import getopt
+import subprocess
+
+srcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "pyxygen")
+
+# 网络、进程池、服务等只在特定运行方式下才需要的模块
+heavyModules = ["urllib.request", "urllib.error", "http.client", "http.server", "concurrent.futures",
+    "multiprocessing", "tracemalloc", "mimetypes", "base64", "gzip", "zlib", "hashlib", "asyncio"]
+
+sample = '''<html><head><title>startup</title></head><body><div><p>{}</p></div></body></html>'''.format(
+    "正文内容 " * 200)
+
+# (名称, 命令行参数, stdin输入, 耗时预算（毫秒）, 不应导入的模块)
+# 进程启动耗时波动较大，预算约为正常耗时的2倍以上，主要用于发现重新在模块顶层导入bs4等较大模块的改动，
+# 以及htmlarticle.py的编译耗时的明显增长；导入的模块不受耗时波动影响，是主要的检查项
+# 不应导入的模块为None时，使用heavyModules中bs4本身不会导入的模块
+cases = [
+    ("htmlarticle.py -h", ["htmlarticle.py", "-h"], "", 150,
+        ["bs4"] + heavyModules),
+    ("html2epub.py -h", ["html2epub.py", "-h"], "", 60,
+        ["bs4", "htmlarticle", "zipfile", "tempfile", "shutil"] + heavyModules),
+    ("htmlarticle -h", ["-m", "htmlarticle", "-h"], "", 80,
+        ["bs4"] + heavyModules),
+    ("htmlarticle stdin", ["-m", "htmlarticle", "--parser", "html.parser"], sample, 400,
+        None),
+    ("html2epub -h", ["-m", "html2epub", "-h"], "", 60,
+        ["bs4", "htmlarticle", "zipfile", "tempfile", "shutil"] + heavyModules),
+    ("passgen -h", ["-m", "passgen", "-h"], "", 40,
+        ["random"]),
+    ("passgen", ["-m", "passgen", "-n", "3"], "", 40,
+        []),
+]
+
+
+def importedModules(stderr):
+    ''' 从 -X importtime 的输出中取出导入的模块名称 '''
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def run(args, stdin, number):
+    ''' 运行number次，返回(最快一次的耗时（秒）, 导入的模块) '''
+    best = None
+    modules = set()
+    for _ in range(number):
+        t = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime"] + args, input = stdin.encode('utf-8'),
+            stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, cwd = srcdir)
+        elapsed = time.perf_counter() - t
+        if proc.returncode != 0:
+            sys.exit("运行失败：{}\n{}".format(" ".join(args), proc.stderr.decode('utf-8', 'replace')))
+        if best is None or elapsed < best:
+            best = elapsed
+        modules = importedModules(proc.stderr.decode('utf-8', 'replace'))
+    return (best, modules)
+
+
+if __name__ == '__main__':
+
+    number = 10
+    scale = 1.0
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:", ["scale="])
+        for i, j in opts:
+            if i == "-n":
+                number = int(j)
+            elif i == "--scale":
+                scale = float(j)
+    except (getopt.GetoptError, ValueError):
+        sys.exit("参数输入错误")
+
+    # 预先编译，使用-m运行时第一次运行也不包含编译的耗时
+    import compileall
+    compileall.compile_dir(srcdir, quiet = 1)
+
+    # 空解释器的启动耗时，以及bs4自身会导入的模块
+    baseline, _ = run(["-c", "pass"], "", number)
+    _, bs4Modules = run(["-c", "import bs4"], "", 1)
+
+    failed = 0
+    print("{:<20}{:>10}{:>10}  {}".format("case", "ms", "budget", "result"))
+    for name, args, stdin, budget, forbidden in cases:
+        if forbidden is None:
+            forbidden = [m for m in heavyModules if m not in bs4Modules]
+        elapsed, modules = run(args, stdin, number)
+        ms = max(0.0, elapsed - baseline) * 1000
+        problems = []
+        if ms > budget * scale:
+            problems.append("超过预算")
+        loaded = [m for m in forbidden if m in modules]
+        if loaded:
+            problems.append("导入了：" + "、".join(loaded))
+        if problems:
+            failed += 1
+        print("{:<20}{:>8.1f}ms{:>8.0f}ms  {}".format(name, ms, budget * scale,
+            "FAIL " + "；".join(problems) if problems else "ok"))
+
+    if failed > 0:
+        sys.exit(1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+'''基准测试使用的html语料
+
+   所有网页均使用固定的随机数种子生成，每次运行生成的内容完全相同，不需要访问网络。'''
+
+import os.path
+import random
+
+
+# 保存真实网页的目录，其中的.html文件会被加入到完整的语料中
+recordedDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+_words = ("中文 正文 内容 文章 段落 测试 网页 提取 lorem ipsum dolor sit amet consectetur "
+    "adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua").split()
+
+
+def _sentence(r, n):
+    return " ".join(r.choice(_words) for _ in range(n))
+
+
+def generatePage(seed, blocks, images = 0):
+    ''' 生成一个模拟的文章页面：导航、侧边栏、正文段落、代码、评论、脚本、页脚
+
+        参数说明：
+            seed        随机数种子
+            blocks      正文之外各部分的块数，决定网页的大小
+            images      正文中的图片个数
+    '''
+    r = random.Random(seed)
+    out = []
+    out.append('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>测试页面 {}</title>'.format(seed))
+    out.append('<style>body {{ margin: 0 }}</style><script>var page = {};</script></head>'.format(seed))
+    out.append('<body class="page">\n<nav><a href="/">首页</a> <a href="/list">列表</a></nav>')
+    out.append('<header><h1>网站名称</h1></header>')
+
+    for i in range(blocks):
+        out.append('<div class="side"><ul>')
+        for j in range(r.randint(2, 6)):
+            out.append('<li><a href="/item/{}/{}">{}</a></li>'.format(i, j, _sentence(r, 3)))
+        out.append('</ul></div>')
+        if r.random() < 0.3:
+            out.append('<!-- 广告位 {} -->\n<div class="ad"><iframe src="/ad/{}"></iframe></div>'.format(i, i))
+        if r.random() < 0.2:
+            out.append('<script>track({});</script>'.format(i))
+
+    out.append('<div class="article">')
+    for i in range(blocks):
+        out.append('<p style="text-indent: 2em">{}</p>'.format(_sentence(r, r.randint(20, 80))))
+        if i < images:
+            out.append('<p><img src="images/{}.jpg" alt="图片 {}"></p>'.format(i, i))
+        if r.random() < 0.05:
+            out.append('<pre class="code">\nfor i in range(10):\n    print(i &lt; 5)\n</pre>')
+    out.append('</div>')
+
+    for i in range(blocks // 2):
+        out.append('<div class="comment"><span>{}</span>: {}</div>'.format(_sentence(r, 1), _sentence(r, 8)))
+
+    out.append('<footer>版权所有</footer>\n</body></html>')
+    return "\n".join(out)
+
+
+def generateNested(seed, depth, paragraphs = 50):
+    ''' 生成一个嵌套很深的页面，正文位于depth层div之中 '''
+    r = random.Random(seed)
+    out = ['<html><head><title>嵌套页面 {}</title></head><body>'.format(seed)]
+    out.append('<div>' * depth)
+    for i in range(paragraphs):
+        out.append('<p>{}</p>'.format(_sentence(r, r.randint(20, 60))))
+    out.append('</div>' * depth)
+    out.append('</body></html>')
+    return "\n".join(out)
+
+
+def minify(html):
+    ''' 去掉html中的换行，模拟压缩成一行的网页 '''
+    return html.replace("\n", "")
+
+
+def recordedPages():
+    ''' 返回corpus目录中保存的真实网页，为(名称, html)列表，按文件名排序 '''
+    pages = []
+    if not os.path.isdir(recordedDir):
+        return pages
+    for filename in sorted(os.listdir(recordedDir)):
+        if filename.endswith((".html", ".htm")):
+            with open(os.path.join(recordedDir, filename), encoding = 'utf-8', errors = 'replace') as f:
+                pages.append(("recorded:" + filename, f.read()))
+    return pages
+
+
+def fixedCorpus():
+    ''' 返回固定的语料，为(名称, html)列表 '''
+    return [
+        ("small", generatePage(1, 20)),
+        ("medium", generatePage(2, 200, images = 10)),
+        ("large", generatePage(3, 2000, images = 30)),
+    ]
+
+
+def fullCorpus():
+    ''' 返回完整的语料：不同大小的页面（最大约6MB）、深层嵌套页面、压缩为一行的页面，以及corpus目录中的真实网页 '''
+    return fixedCorpus() + [
+        ("huge", generatePage(4, 8000, images = 60)),
+        ("nested", generateNested(5, 400)),
+        ("oneline", minify(generatePage(6, 200, images = 10))),
+    ] + recordedPages()
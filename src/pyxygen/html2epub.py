@@ -11,23 +11,19 @@
 更多 Pyxygen 程序请访问：https://github.com/m3ng9i/Pyxygen'''
 
 
-import zipfile
 import os
 import os.path
-import tempfile
-import mimetypes
-import hashlib
 import time
-import shutil
 import sys
 import getopt
-from bs4 import BeautifulSoup
-import htmlarticle
+
+# bs4、htmlarticle、zipfile等模块在用到的函数中导入，使-h等运行方式只加载必需的模块
 
 
 def mediaType(filename):
     '根据文件名获取文件的mediatype'
 
+    import mimetypes
     mime = mimetypes.guess_type(os.path.basename(filename))
     if mime[0] is None:
         return "application/octet-stream"
@@ -39,6 +35,7 @@ def mediaType(filename):
 
 def hashfiles(files):
     ''' 计算多个文件的合并了的md5值，files是列表 '''
+    import hashlib
     h = hashlib.md5()
     for filename in files:
         with open(filename, mode = 'rb') as f:
@@ -50,12 +47,14 @@ def hashfiles(files):
     return h.hexdigest()
 
 
-def getTitle(path):
+def getTitle(path, parser = "html.parser"):
     ''' 打开html文件，取title标签的值，没有取到时返回空字符串
+        parser为解析html时使用的解析器
         可能抛出的异常：IOError
     '''
+    from bs4 import BeautifulSoup
     html = open(path).read()
-    soap = BeautifulSoup(html)
+    soap = BeautifulSoup(html, parser)
     title = soap.title
     if title is None:
         return ''
@@ -94,6 +93,7 @@ class CreateEpub():
             返回值：临时目录对象
         '''
         
+        import tempfile
         tmp = tempfile.TemporaryDirectory()
         tmpdir = tmp.name
         
@@ -199,7 +199,7 @@ class CreateEpub():
         for i in self.__srcfiles:
             if mediaType(i) == "application/xhtml+xml":
                 src = os.path.join("content", i)
-                title = getTitle(os.path.abspath(os.path.join(self.__tmpdir, "OEBPS", src)))
+                title = getTitle(os.path.abspath(os.path.join(self.__tmpdir, "OEBPS", src)), self.__parser)
                 if title.strip() == "":
                     title = "无标题"
 
@@ -245,6 +245,7 @@ class CreateEpub():
         os.chdir(src)
         
         # 遍历src文件夹，将其中所有文件（点开头的文件或目录除外）添加到压缩文件中
+        import zipfile
         pos = len(src) + 1
         with zipfile.ZipFile(dest, 'w', zipfile.ZIP_DEFLATED) as z:
 
@@ -269,21 +270,26 @@ class CreateEpub():
                     z.write(os.path.join(curdir, f))
 
 
-    def __init__(self, srcfiles, destfile, name = ""):
+    def __init__(self, srcfiles, destfile, name = "", parser = None):
         ''' 参数说明：
             srcfiles    要添加到epub中的文件名称（列表），文件顺序决定了在epub中的顺序
                         所有文件的文件名(basename)不能相同
             destfile    生成的电子书路径及文件名        
             name        epub电子书名称，如果为空字符串，则自动生成电子书名
+            parser      解析html时使用的解析器，为None表示使用可用的最快的解析器
 
             可能会抛出的异常：
             FileNotFoundError   要添加到epub的文件不存在，或者要添加的是一个目录而不是文件
             shutil.Error        复制文件时出错
             ValueError          要添加到epub的文件名有重复
         '''
+        import shutil
+        import htmlarticle
+
         self.__srcfiles = [] # 在临时目录/OEBPS/content目录中的文件的文件名
         self.__destfile = destfile
         self.__name = name
+        self.__parser = htmlarticle.checkParser(parser)
 
         if len(srcfiles) == 0:
             raise ValueError("参数srcfiles值为空")
@@ -308,7 +314,7 @@ class CreateEpub():
                 path = os.path.join(self.__tmpdir, "OEBPS", "content", src)
                 if mediaType(path) == "application/xhtml+xml":
                     hasHtml = True
-                    self.__name = getTitle(path)
+                    self.__name = getTitle(path, self.__parser)
             if hasHtml is False:
                 raise ValueError("srcfiles中并未提供html文件")
 
@@ -346,6 +352,22 @@ def usage():
     -o, --output <filename>         设置epub输出路径和文件名
     -n, --name <name>               设置电子书名，如果不提供，则以第一个html文件中的title为电子书名，
         --ua <useragent>            设置抓取网页时的useragent
+        --imagecache <dir>          设置图片缓存目录，使用-u参数时，抓取图片优先从缓存读取
+        --imagesize <w[xh]>         使用-u参数时，缩小超过此尺寸的图片，例如1200x1600，只给出宽度时不限制高度
+        --imagequality <n>          使用-u参数时，重新压缩图片，JPEG、WEBP的压缩质量为1-95，默认为85
+        --imageformat <fmt>         使用-u参数时，将图片转换为jpeg、png或webp格式，默认保持原来的格式
+                                    以上三个参数需要安装Pillow，处理后的图片去除了exif等元数据
+        --httpcache <dir>           设置网页缓存目录，使用-u参数时，网页未修改则从缓存读取
+        --refresh                   不使用网页缓存中的内容，重新下载网页并更新缓存
+        --hostconcurrency <n>       使用-u参数时，限制对同一网站同时进行的请求数，默认不限制
+        --hostrate <r>              使用-u参数时，限制对同一网站每秒发送的请求数，可以为小数，默认不限制
+        --connecttimeout <s>        使用-u参数时，建立连接的超时时间（秒），默认为10
+        --readtimeout <s>           使用-u参数时，等待服务器响应的超时时间（秒），默认为30
+        --retries <n>               使用-u参数时，连接失败、超时或服务器返回5xx时最多重试的次数，默认为2
+        --hedge <s>                 使用-u参数时，抓取图片超过s秒未完成则再发送一个相同的请求，默认不发送
+        --parser <name>             设置html解析器，可以为lxml、html.parser、html5lib，默认使用可用的最快的解析器
+        --engine <name>             使用-u参数时，确定正文位置的方法，lines（默认）按行统计字数，
+                                    dom对网页的区块打分，适合压缩成一行的网页
     -p, --path <path>               设置包含html及相关代码的目录
     -u, --url <url> [url2 ...]      指定一个或多个url
     -f, --file <file> [file2 ...]   指定一个或多个本地文件
@@ -361,13 +383,20 @@ def usage():
     将两个网页作为内容创建为电子书
     html2epub.py -o /tmp/book.epub -n 电子书名称 -u http://example.com/1 http://example.com/1
 
+    抓取网页，将图片缩小到宽度不超过1200，并重新压缩，减小电子书的体积
+    html2epub.py -o /tmp/book.epub --imagesize 1200 --imagequality 75 -u http://example.com/1
+
+    抓取同一网站的多个网页，每秒最多发送2个请求，同时最多进行2个请求
+    html2epub.py -o /tmp/book.epub --hostrate 2 --hostconcurrency 2 -u http://example.com/1 http://example.com/2
+
     将两个html文件作为内容创建为电子书，电子书名称为与第一个html文件中的title字段相同
     html2epub.py -o /tmp/book.epub -f /tmp/1.html /tmp/2.html'''
 
     print(s)
 
 
-def fetchFiles(src, srctype, useragent):
+def fetchFiles(src, srctype, useragent, imageCache = None, httpCache = None, parser = None, imageProcessor = None,
+        hostScheduler = None, connectTimeout = 10, readTimeout = 30, retries = 2, hedgeDelay = 0, engine = "lines"):
     ''' 获取要添加到epub中的文件
 
         参数说明：
@@ -376,7 +405,18 @@ def fetchFiles(src, srctype, useragent):
                     path：表示src为一个本地目录，将此目录中所有的文件添加到epub
                     file：表示src为一个或多个要添加到epub中的文件路径
                     url：表示src为一个或多个要添加到epub中的url
-        useragent   user agent
+        useragent   user agent，为None时使用htmlarticle.mobileUseragent
+        imageCache  htmlarticle.ImageCache对象，抓取网页中的图片时使用的缓存，为None表示不使用缓存
+        httpCache   htmlarticle.HttpCache对象，抓取网页时使用的http缓存，为None表示不使用缓存
+        parser      解析html时使用的解析器，为None表示使用可用的最快的解析器
+        imageProcessor  htmlarticle.ImageProcessor对象，用于缩小、重新压缩网页中的图片，为None表示不处理
+        hostScheduler   htmlarticle.HostScheduler对象，限制对每个网站的并发请求数及请求速率，
+                        为None表示不限制，但仍然遵守服务器返回的Retry-After
+        connectTimeout  建立连接的超时时间（秒）
+        readTimeout     等待服务器响应的超时时间（秒）
+        retries         连接失败、超时或服务器返回5xx时最多重试的次数
+        hedgeDelay      抓取图片超过hedgeDelay秒未完成时再发送一个相同的请求，0表示不发送
+        engine          确定正文位置的方法，见htmlarticle.engines
 
         可能抛出的异常
         TypeError               参数src类型不对
@@ -424,22 +464,44 @@ def fetchFiles(src, srctype, useragent):
             raise TypeError("当srctype为url时，src只能为字符串或列表。")
 
 
+        import tempfile
+        import htmlarticle
+
+        if useragent is None:
+            useragent = htmlarticle.mobileUseragent
+
         tmp = tempfile.TemporaryDirectory()
         n = 1 # html文件计数
 
+        # 所有网页及图片共用一个连接池，同一个网站的请求可以复用连接
+        if hostScheduler is None:
+            hostScheduler = htmlarticle.HostScheduler()
+        pool = htmlarticle.ConnectionPool(scheduler = hostScheduler, connectTimeout = connectTimeout,
+                readTimeout = readTimeout, retries = retries)
+
         # 遍历src列表，抓取所有的html页面，图片已内置到网页中
         # 可能发生的异常：urllib.error.URLError、ValueError、IOError
         for s in src:
-            article = htmlarticle.Article(url = s, useragent = useragent)
+            article = htmlarticle.Article(url = s, useragent = useragent, imageCache = imageCache,
+                    connectionPool = pool, httpCache = httpCache, parser = parser, imageProcessor = imageProcessor,
+                    hedgeDelay = hedgeDelay, lowMemory = True, engine = engine)
             article.fetchPage()
             article.preprocess()
             html = article.article()
+            if httpCache is not None:
+                httpCache.flush()
+            for record in article.stats().failedFetches():
+                print("未能嵌入图片：{}（{}）".format(record["url"], record["error"]), file = sys.stderr)
 
             path = os.path.join(tmp.name, "{}.html".format(n))
             with open(path, 'wt') as f:
                 f.write(html)
                 result.append(path)
-            n += 1                
+            n += 1
+            # 网页较多时，及时释放上一个网页占用的内存
+            del article, html
+
+        pool.close()
     else:
         raise ValueError("参数srctype只能为path、file或url")
 
@@ -453,10 +515,27 @@ if __name__ == '__main__':
     src = []
     output = ""
     name = ""
-    useragent = htmlarticle.mobileUseragent
+    useragent = None
+    imageCache = None
+    imageSize = None
+    imageQuality = None
+    imageFormat = None
+    httpCacheDir = None
+    refresh = False
+    hostConcurrency = 0
+    hostRate = 0
+    connectTimeout = 10
+    readTimeout = 30
+    retries = 2
+    hedgeDelay = 0
+    parser = None
+    engine = "lines"
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "n:po:ufh", ["name=", "ua=", "path", "output=", "url", "file", "help"]) 
+        opts, args = getopt.getopt(sys.argv[1:], "n:po:ufh",
+                [   "name=", "ua=", "imagecache=", "imagesize=", "imagequality=", "imageformat=", "httpcache=",
+                    "refresh", "hostconcurrency=", "hostrate=", "connecttimeout=", "readtimeout=", "retries=",
+                    "hedge=", "parser=", "engine=", "path", "output=", "url", "file", "help"])
 
         n = 0 # 记录p、u、f参数出现的次数
         for i, j in opts:
@@ -468,6 +547,81 @@ if __name__ == '__main__':
                 name = j
             elif i == "--ua":
                 useragent = j
+            elif i == "--imagecache":
+                import htmlarticle
+                try:
+                    imageCache = htmlarticle.ImageCache(j)
+                except OSError as e:
+                    sys.exit("无法使用图片缓存目录：{}".format(e))
+            elif i == "--imagesize":
+                import htmlarticle
+                try:
+                    imageSize = htmlarticle.parseImageSize(j)
+                except ValueError:
+                    sys.exit("--imagesize参数值格式错误，应为<宽>x<高>或<宽>")
+            elif i == "--imagequality":
+                errstr = "--imagequality参数值只能为1-95的整数"
+                try:
+                    imageQuality = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if not 1 <= imageQuality <= 95:
+                    sys.exit(errstr)
+            elif i == "--imageformat":
+                imageFormat = j
+            elif i == "--httpcache":
+                httpCacheDir = j
+            elif i == "--refresh":
+                refresh = True
+            elif i == "--hostconcurrency":
+                errstr = "--hostconcurrency参数值只能为正整数"
+                try:
+                    hostConcurrency = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if hostConcurrency <= 0:
+                    sys.exit(errstr)
+            elif i == "--hostrate":
+                errstr = "--hostrate参数值只能为正数"
+                try:
+                    hostRate = float(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if not hostRate > 0:
+                    sys.exit(errstr)
+            elif i in ["--connecttimeout", "--readtimeout", "--hedge"]:
+                errstr = "{}参数值只能为正数".format(i)
+                try:
+                    value = float(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if not value > 0:
+                    sys.exit(errstr)
+                if i == "--connecttimeout":
+                    connectTimeout = value
+                elif i == "--readtimeout":
+                    readTimeout = value
+                else:
+                    hedgeDelay = value
+            elif i == "--retries":
+                errstr = "--retries参数值只能为非负整数"
+                try:
+                    retries = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if retries < 0:
+                    sys.exit(errstr)
+            elif i == "--parser":
+                import htmlarticle
+                try:
+                    parser = htmlarticle.checkParser(j)
+                except ValueError as e:
+                    sys.exit(str(e))
+            elif i == "--engine":
+                import htmlarticle
+                if j not in htmlarticle.engines:
+                    sys.exit("--engine参数值只能为{}".format("、".join(htmlarticle.engines)))
+                engine = j
             elif i in ['-p', '--path']:
                 srctype = "path"
                 n += 1
@@ -493,9 +647,35 @@ if __name__ == '__main__':
 
     output = os.path.abspath(output)
 
+    httpCache = None
+    if httpCacheDir is not None:
+        import htmlarticle
+        try:
+            httpCache = htmlarticle.HttpCache(httpCacheDir, refresh = refresh)
+        except OSError as e:
+            sys.exit("无法使用网页缓存目录：{}".format(e))
+
+    imageProcessor = None
+    if imageSize is not None or imageQuality is not None or imageFormat is not None:
+        import htmlarticle
+        width, height = imageSize or (0, 0)
+        try:
+            imageProcessor = htmlarticle.ImageProcessor(width, height, imageQuality or 85, imageFormat)
+        except ImportError:
+            sys.exit("--imagesize、--imagequality、--imageformat参数需要安装Pillow：pip install Pillow")
+        except ValueError as e:
+            sys.exit(str(e))
+
+    hostScheduler = None
+    if hostConcurrency > 0 or hostRate > 0:
+        import htmlarticle
+        hostScheduler = htmlarticle.HostScheduler(hostConcurrency, hostRate)
+
     try:
-        srcfiles, _ = fetchFiles(src, srctype, useragent)
-        CreateEpub(srcfiles, output, name)
+        srcfiles, _ = fetchFiles(src, srctype, useragent, imageCache, httpCache, parser, imageProcessor, hostScheduler,
+                connectTimeout = connectTimeout, readTimeout = readTimeout, retries = retries, hedgeDelay = hedgeDelay,
+                engine = engine)
+        CreateEpub(srcfiles, output, name, parser)
     except KeyboardInterrupt:
         sys.exit()
     except Exception as e:
@@ -20,16 +20,39 @@ import sys
 import os.path
 import getopt
 import html
-import base64
-import mimetypes
-import urllib.request
+import json
+import time
+import threading
+import codecs
+import functools
+import contextlib
 import urllib.parse
-from bs4 import BeautifulSoup
+
+# bs4、urllib.request、http.client等模块导入较慢，在用到的函数中导入，
+# 使-h、从stdin读取html等不需要网络的运行方式只加载必需的模块
+
+
+# 以下函数在整个网页上查找标签，不使用.*?等在匹配失败时会从每个起点重新扫描到结尾的正则表达式，
+# 结果与注释中给出的正则表达式相同，耗时与html的长度成正比，未闭合的注释、pre标签等不会使处理变慢
 
 
 def removeHtmlComments(htm):
-    '将html中的注释去除'
-    return re.sub("<!--.*?-->", "", htm, flags = re.DOTALL)
+    ''' 将html中的注释去除，结果与 re.sub("<!--.*?-->", "", htm, flags = re.DOTALL) 相同
+        某个注释没有结尾时，之后的注释都不会被匹配，保留原样
+    '''
+    parts = []
+    pos = 0
+    while True:
+        start = htm.find("<!--", pos)
+        if start < 0:
+            break
+        end = htm.find("-->", start + 4)
+        if end < 0:
+            break
+        parts.append(htm[pos:start])
+        pos = end + 3
+    parts.append(htm[pos:])
+    return "".join(parts)
 
 
 def removeEmptyHtmlTags(soap):
@@ -47,14 +70,136 @@ def removeEmptyHtmlTags(soap):
     return soap
 
 
+_preStartPattern = re.compile("<pre", flags = re.IGNORECASE)
+_preEndPattern = re.compile("</pre>", flags = re.IGNORECASE)
+
+
 def pre2p(s):
-    '将pre标签内容转换为p标签，pre里面的html实体标签进行一下转换，其他内容保持不变'
-    def repl(match):
+    ''' 将pre标签内容转换为p标签，pre里面的html实体标签进行一下转换，其他内容保持不变
+        匹配的pre标签与 re.sub(r"<pre[^>]*>(.*?)</pre>", ..., flags = re.IGNORECASE | re.DOTALL) 相同
+    '''
+    def repl(content):
         ''' 将pre标签内部字符串，先去掉头尾多余的换行符和空格，然后将html中的尖括号等符号转码
             然后将换行符修改为<br />，然后再在头尾包裹上p标签
         '''
-        return "<p>" + "<br />".join(html.escape(match.group(1).strip()).splitlines()) + "</p>"
-    return re.sub(r"<pre[^>]*>(.*?)</pre>", repl, s, flags = re.IGNORECASE | re.DOTALL)
+        return "<p>" + "<br />".join(html.escape(content.strip()).splitlines()) + "</p>"
+
+    parts = []
+    pos = 0
+    while True:
+        # 开始标签在<pre之后的第一个>处结束，找不到>或者</pre>时，之后的pre标签也都无法匹配
+        start = _preStartPattern.search(s, pos)
+        if start is None:
+            break
+        content = s.find(">", start.end())
+        if content < 0:
+            break
+        end = _preEndPattern.search(s, content + 1)
+        if end is None:
+            break
+        parts.append(s[pos:start.start()])
+        parts.append(repl(s[content + 1:end.start()]))
+        pos = end.end()
+    parts.append(s[pos:])
+    return "".join(parts)
+
+
+_bodyStartPattern = re.compile("<body", flags = re.IGNORECASE)
+_bodyEndPattern = re.compile("</body>", flags = re.IGNORECASE)
+
+
+def hasBodyTag(htm):
+    ''' 判断html中是否有完整的body标签，结果与
+        re.search("<body[^>]*>(.*)</body>", htm, flags = re.IGNORECASE | re.DOTALL) is not None 相同
+    '''
+    # 第一个<body之后的第一个>是最早结束的开始标签，只要其后有</body>即可
+    start = _bodyStartPattern.search(htm)
+    if start is None:
+        return False
+    end = htm.find(">", start.end())
+    return end >= 0 and _bodyEndPattern.search(htm, end + 1) is not None
+
+
+# BeautifulSoup支持的html解析器，按照解析速度从快到慢排列
+parsers = ["lxml", "html.parser", "html5lib"]
+
+
+def availableParsers():
+    ''' 返回当前系统中可用的html解析器列表，按照解析速度从快到慢排列 '''
+    from bs4.builder import builder_registry
+    return [p for p in parsers if builder_registry.lookup(p) is not None]
+
+
+def defaultParser():
+    ''' 返回可用的最快的html解析器，安装了lxml时为lxml，否则为python标准库中的html.parser '''
+    return availableParsers()[0]
+
+
+def checkParser(parser):
+    ''' 检查html解析器是否可用，parser为None时返回defaultParser()，不可用时抛出ValueError异常 '''
+
+    if parser is None:
+        return defaultParser()
+    if parser not in parsers:
+        raise ValueError("不支持的html解析器：{}，可以使用：{}".format(parser, "、".join(parsers)))
+    if parser not in availableParsers():
+        raise ValueError("html解析器{}未安装".format(parser))
+    return parser
+
+
+def parseFragment(htm, parser):
+    ''' 使用指定的解析器解析html片段，返回包含这个片段的节点
+
+        html.parser解析时原样保留html片段，返回BeautifulSoup对象；
+        lxml、html5lib会为片段补全html、body标签，此时返回body节点
+    '''
+    from bs4 import BeautifulSoup
+    soap = BeautifulSoup(htm, parser)
+    if parser != "html.parser" and soap.body is not None:
+        return soap.body
+    return soap
+
+
+@functools.lru_cache(maxsize = None)
+def _rawHtmlClass():
+    ''' 返回RawHtml类，RawHtml继承自bs4中的类，在第一次使用时才定义 '''
+
+    from bs4.element import PreformattedString
+
+    class RawHtml(PreformattedString):
+        ''' 插入到BeautifulSoup对象中的html代码，输出时不进行转义 '''
+        pass
+
+    return RawHtml
+
+
+def removeCommentNodes(soap):
+    ''' 删除BeautifulSoup对象中的注释节点，结果与对str(soap)使用removeHtmlComments相同
+
+        参数soap是一个BeautifulSoup对象，返回值同样为一个BeautifulSoup对象
+    '''
+    from bs4.element import Comment
+    for i in soap.find_all(string = lambda text: isinstance(text, Comment)):
+        i.extract()
+    return soap
+
+
+def pre2pNodes(soap):
+    ''' 将BeautifulSoup对象中的pre标签转换为p标签，转换方法与pre2p相同
+
+        参数soap是一个BeautifulSoup对象，返回值同样为一个BeautifulSoup对象
+    '''
+    RawHtml = _rawHtmlClass()
+    # 嵌套在其他pre标签中的pre标签随外层标签一起转换。find_all按文档顺序返回，外层标签总在内层之前，
+    # 转换外层标签时记录其中的pre标签，不对每个pre标签查找父节点，大量嵌套的pre标签不会使耗时成倍增加
+    nested = set()
+    for pre in soap.find_all('pre'):
+        if id(pre) in nested:
+            continue
+        nested.update(id(i) for i in pre.find_all('pre'))
+        s = "<p>" + "<br />".join(html.escape(pre.decode_contents().strip()).splitlines()) + "</p>"
+        pre.replace_with(RawHtml(s))
+    return soap
 
 
 def removeHtmlAttributes(soap, attrs = []):
@@ -72,9 +217,333 @@ def removeHtmlAttributes(soap, attrs = []):
     return soap
 
 
-def guessImageType(imgurl):
-    '根据图片的完整url猜测其mimetype类型，如果未获取到，则认为其为jpg格式'
+# 匹配一个完整的开始标签或结束标签
+_tagPattern = re.compile(r"</?[a-zA-Z][^<>]*>")
+# 匹配BeautifulSoup和pre2p输出的html实体
+_entityPattern = re.compile(r"&(?:amp|lt|gt|quot|#x27|#39);")
+# 这些标签中的文字不会被BeautifulSoup的get_text()计入，或者其中的空白会被原样保留
+_rawTextPattern = re.compile(r"<(?:script|style|template|pre|textarea)[\s/>]", flags = re.IGNORECASE)
+_asciiSpaces = "\x20\x0a\x09\x0c\x0d"
+_entities = {"&amp;": "&", "&lt;": "<", "&gt;": ">", "&quot;": '"', "&#x27;": "'", "&#39;": "'"}
+
+
+def textLength(line):
+    ''' 计算一行html代码中去掉html标签、去掉前后的空格后的字符个数
+
+        结果与 len(BeautifulSoup(line, "html.parser").get_text().strip()) 相同。
+        对于常见的由BeautifulSoup输出的html，使用正则表达式直接去除标签和转换实体；
+        遇到不完整的标签、其他实体、script等特殊标签时，仍然使用BeautifulSoup进行解析。
+    '''
+    if "<" not in line and "&" not in line:
+        return len(line.strip())
+
+    if _rawTextPattern.search(line) is None:
+        text = _tagPattern.sub("", line)
+        # 去掉完整的标签后，如果仍有<或者无法识别的实体，交给BeautifulSoup处理
+        if "<" not in text and "&" not in _entityPattern.sub("", text):
+            # BeautifulSoup会将标签之间只包含空白的字符串替换为一个空格
+            segments = []
+            for seg in _tagPattern.split(line):
+                if seg != "" and seg.strip(_asciiSpaces) == "":
+                    seg = " "
+                segments.append(seg)
+            text = _entityPattern.sub(lambda m: _entities[m.group(0)], "".join(segments))
+            return len(text.strip())
+
+    from bs4 import BeautifulSoup
+    return len(BeautifulSoup(line, "html.parser").get_text().strip())
 
+
+# 匹配img标签，group(2)为图片地址，在整个html中查找时使用findImgTags()
+_imgPattern = re.compile(r"""<img([^>]*?) src=['"]([^>'"]+)['"]([^>]*)>""", flags = re.IGNORECASE | re.DOTALL)
+_imgStartPattern = re.compile("<img", flags = re.IGNORECASE)
+
+
+def findImgTags(htm):
+    ''' 返回htm中所有img标签的匹配结果（迭代器），结果与 _imgPattern.finditer(htm) 相同
+
+        每个<img只在到下一个>为止的范围内匹配，耗时与htm的长度成正比。
+        直接使用finditer时，大量没有>的<img会使每次匹配都扫描到结尾。
+    '''
+    pos = 0
+    while True:
+        start = _imgStartPattern.search(htm, pos)
+        if start is None:
+            return
+        end = htm.find(">", start.end())
+        if end < 0:
+            return
+        # 匹配不能越过>，这个范围内从start开始匹配失败时，从范围内其他<img开始也会失败
+        match = _imgPattern.match(htm, start.start(), end + 1)
+        if match is not None:
+            yield match
+        pos = end + 1
+
+
+def lineStat(linechars, rows):
+    ''' 统计每一行及其上下rows行（共2*rows+1行）的字符个数之和，返回与linechars等长的列表
+
+        参数说明：
+            linechars   列表，保存每一行的字符个数
+            rows        统计的上下行数
+
+        第n行的统计范围为linechars[n-rows-1:n+rows]，当n-rows-1小于0时，统计范围为linechars[0:1+2*rows]。
+        使用前缀和计算，每一行的统计为O(1)，整体为O(n)。
+    '''
+    total = len(linechars)
+
+    # prefix[i]为linechars[0:i]的和
+    prefix = [0]
+    s = 0
+    for c in linechars:
+        s += c
+        prefix.append(s)
+
+    # 开头rows+1行的统计范围相同
+    head = prefix[min(1 + 2 * rows, total)]
+
+    linestat = []
+    for n in range(total):
+        r1 = n - rows - 1
+        if r1 < 0:
+            linestat.append(head)
+        else:
+            linestat.append(prefix[min(n + rows, total)] - prefix[r1])
+    return linestat
+
+
+def lineStatNumpy(linechars, rows):
+    ''' lineStat的NumPy向量化实现，结果与lineStat相同，适合行数很多的文档
+        如果没有安装NumPy，抛出ImportError异常
+    '''
+    import numpy
+
+    total = len(linechars)
+    prefix = numpy.zeros(total + 1, dtype = numpy.int64)
+    numpy.cumsum(numpy.asarray(linechars, dtype = numpy.int64), out = prefix[1:])
+
+    n = numpy.arange(total)
+    r1 = n - rows - 1
+    r2 = numpy.minimum(n + rows, total)
+    # 开头rows+1行的统计范围为[0, 1+2*rows)
+    head = r1 < 0
+    r2[head] = min(1 + 2 * rows, total)
+    r1[head] = 0
+
+    return (prefix[r2] - prefix[r1]).tolist()
+
+
+# 行数超过此值时，如果安装了NumPy，使用lineStatNumpy进行统计
+numpyLineThreshold = 20000
+
+
+def scoreLines(linechars, linestat, chars):
+    ''' 统计linestat中大于等于chars的行（即被判断为正文的行），返回字典：
+
+            lines           被选中的行的序号列表
+            selectedLines   被选中的行数
+            selectedChars   被选中的行的字符个数之和
+            coverage        selectedChars占全部字符个数的比例
+            blocks          被选中的行组成的连续区块个数
+            largestBlock    字符个数最多的区块，(起始行, 结束行)，结束行不包含在区块内，没有选中任何行时为None
+            largestChars    largestBlock的字符个数
+    '''
+    lines = [n for n, stat in enumerate(linestat) if stat >= chars]
+
+    blocks = 0
+    largestBlock = None
+    largestChars = 0
+    start = None
+    blockChars = 0
+    for i, n in enumerate(lines):
+        if start is None or n != lines[i - 1] + 1:
+            start = n
+            blockChars = 0
+            blocks += 1
+        blockChars += linechars[n]
+        # 当前区块已经是字符最多的区块时，字符个数为0的行也要延长区块的结束行
+        if largestBlock is None or largestBlock[0] == start or blockChars > largestChars:
+            largestBlock = (start, n + 1)
+            largestChars = blockChars
+
+    total = sum(linechars)
+    selectedChars = sum(linechars[n] for n in lines)
+    return {"lines": lines, "selectedLines": len(lines), "selectedChars": selectedChars,
+        "coverage": selectedChars / total if total > 0 else 0.0, "blocks": blocks,
+        "largestBlock": largestBlock, "largestChars": largestChars}
+
+
+# 正文提取引擎：lines按行统计字数（依赖网页源码的换行），dom对解析树中的区块打分（与换行无关）
+engines = ["lines", "dom"]
+
+# scoreBlocks()使用的参数：每个块级标签扣除的分数（标签密度）、链接文字的权重（链接密度）
+domTagCost = 20
+domLinkWeight = 1.0
+# 不扣分的行内标签，正文段落中的加粗、链接、图片等不应降低段落的得分
+domInlineTags = frozenset(["a", "abbr", "b", "big", "br", "cite", "code", "del", "em", "font", "i", "img", "ins",
+    "kbd", "mark", "q", "s", "small", "span", "strike", "strong", "sub", "sup", "time", "u", "var", "wbr"])
+# 得分最高的区块的得分不大于此值时，认为网页中没有正文（例如只有导航链接的网页），dom引擎不选出任何内容
+domMinScore = 0
+
+
+# Article在得分最高的区块前后插入的标记，用于从body的html中取出区块
+_blockMarker = "\x00pyxygen-block\x00"
+
+
+def scoreBlocks(root):
+    ''' 对root（BeautifulSoup的Tag）及其中每一个标签打分，返回(得分最高的标签, 得分)
+
+        标签的得分为其中所有文字及子标签得分之和：链接以外的文字每个非空白字符加1分，
+        链接中的文字每个字符扣domLinkWeight分，每个块级标签扣domTagCost分（行内标签见domInlineTags）。
+        导航、相关链接等区块的链接文字多、标签多，得分为负，包含整个正文而不包含这些区块的标签得分最高。
+        pre2pNodes()转换pre标签后插入的RawHtml按其中的文字计分，注释、doctype等不计分。
+        一次正向遍历计算每个节点自身的得分，一次反向遍历将子节点的得分累加到父节点，耗时与节点个数成正比。
+    '''
+
+    from bs4.element import Tag, NavigableString, PreformattedString
+    RawHtml = _rawHtmlClass()
+
+    nodes = [root]
+    nodes.extend(root.descendants)
+
+    # 正向遍历：父节点总在子节点之前，记录每个标签是否位于链接中及自身的得分，文字直接计入父标签
+    inLink = {id(root): root.name == "a"}
+    scores = {id(root): 0.0}
+    for node in nodes[1:]:
+        if isinstance(node, Tag):
+            inLink[id(node)] = inLink[id(node.parent)] or node.name == "a"
+            scores[id(node)] = 0.0 if node.name in domInlineTags else -domTagCost
+        elif isinstance(node, NavigableString):
+            if isinstance(node, RawHtml):
+                # 其中只有pre2pNodes()生成的p、br标签，文字中的<、>、&已被转义
+                text = html.unescape(_tagPattern.sub("", node))
+            elif isinstance(node, PreformattedString):
+                # 注释、doctype、CDATA等
+                continue
+            else:
+                text = node
+            n = len("".join(text.split()))
+            if n > 0:
+                parent = id(node.parent)
+                scores[parent] += -domLinkWeight * n if inLink[parent] else n
+
+    # 反向遍历：子节点总在父节点之前，将得分累加到父节点，同时找出得分最高的标签
+    best = None
+    for node in reversed(nodes):
+        if isinstance(node, Tag):
+            if node is not root:
+                scores[id(node.parent)] += scores[id(node)]
+            # 得分相同时选择外层的标签
+            if best is None or scores[id(node)] >= scores[id(best)]:
+                best = node
+    return (best, scores[id(best)])
+
+
+# Article.sweep()、Article.autoTune()默认尝试的rows、chars取值
+sweepRows = [3, 5, 10, 15, 20, 30]
+sweepChars = [30, 45, 60, 90, 120, 180, 240]
+
+
+# 分页链接的url格式，group(1)为页码。去掉整个匹配部分后与当前页面的url相同时，认为是同一篇文章的分页
+defaultPagePatterns = [r"[?&](?:page|p|pg|pn)=(\d+)", r"/page/(\d+)/?$", r"_(\d{1,3})(?=\.s?html?$)"]
+# 分页链接的文字长度上限，超过时不认为是分页链接，例如“下一页”、“2”、“Next »”
+pageLinkTextLength = 10
+
+
+def findPageLinks(soap, url, patterns = None, base = None):
+    ''' 在BeautifulSoup对象中查找同一篇文章的其他分页的地址，返回完整url的列表
+
+        参数说明：
+            soap        BeautifulSoup对象
+            url         当前页面的完整url
+            patterns    分页链接的url格式（正则表达式字符串列表），第一个分组为页码，为None时使用defaultPagePatterns
+            base        解析相对地址时使用的base url，为None时使用url
+
+        rel="next"的link、a标签排在前面，其他按照页码从小到大排列，只包含页码大于当前页面（没有页码时为1）的地址，
+        不包含url本身，只返回http、https地址
+    '''
+
+    if patterns is None:
+        patterns = defaultPagePatterns
+    patterns = [re.compile(p, flags = re.IGNORECASE) for p in patterns]
+    if base is None:
+        base = url
+
+    def absolute(href):
+        link = urllib.parse.urldefrag(urllib.parse.urljoin(base, href.strip()))[0]
+        if urllib.parse.urlsplit(link).scheme.lower() not in ["http", "https"]:
+            return None
+        return link
+
+    links = []
+    for tag in soap.find_all(["link", "a"], href = True):
+        rel = tag.get("rel") or []
+        if isinstance(rel, str):
+            rel = rel.split()
+        if "next" in [r.lower() for r in rel]:
+            link = absolute(tag["href"])
+            if link is not None:
+                links.append((-1, len(links), link))
+
+    def pageNumber(match):
+        # patterns可以由用户指定，第一个分组不是数字时不认为是页码
+        if match is None or match.group(1) is None or not match.group(1).isdecimal():
+            return None
+        return int(match.group(1))
+
+    current = urllib.parse.urldefrag(url)[0]
+    for tag in soap.find_all("a", href = True):
+        if len(tag.get_text().strip()) > pageLinkTextLength:
+            continue
+        link = absolute(tag["href"])
+        if link is None:
+            continue
+        for pattern in patterns:
+            match = pattern.search(link)
+            page = pageNumber(match)
+            if page is None:
+                continue
+            # 去掉页码部分后，与当前页面去掉页码部分（或者当前页面本身）相同，并且页码大于当前页面
+            number = pageNumber(pattern.search(current)) or 1
+            stripped = (link[:match.start()] + link[match.end():]).rstrip("/")
+            if stripped == pattern.sub("", current, count = 1).rstrip("/") and page > number:
+                links.append((page, len(links), link))
+            break
+
+    result = []
+    for _, _, link in sorted(links):
+        if link != current and link not in result:
+            result.append(link)
+    return result
+
+
+# 匹配html中的src、href属性，用于将相对地址转换为完整地址
+# 标签部分不越过<，避免大量没有>的<使每次匹配都扫描到结尾。BeautifulSoup输出的标签中出现<时（例如属性名为<），
+# 从标签中最后一个<开始匹配，替换结果相同
+_linkAttrPattern = re.compile(r"""(<[^<>]+?\s(?:src|href)=")([^"]*)(")""", flags = re.IGNORECASE)
+
+
+def absoluteLinks(htm, base):
+    ''' 将html代码中src、href属性的相对地址转换为以base为基准的完整地址 '''
+
+    def repl(match):
+        return match.group(1) + urllib.parse.urljoin(base, match.group(2)) + match.group(3)
+    return _linkAttrPattern.sub(repl, htm)
+
+
+# Pillow的图片格式名称对应的mimetype
+_imageFormatTypes = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+
+def guessImageType(imgurl, format = None):
+    ''' 根据图片的完整url猜测其mimetype类型，如果未获取到，则认为其为jpg格式
+        format为ImageProcessor转换后的图片格式（例如JPEG、PNG、WEBP），给出时返回此格式的mimetype
+    '''
+
+    if format is not None:
+        return _imageFormatTypes.get(format.upper(), "image/" + format.lower())
+
+    import mimetypes
     path = urllib.parse.urlparse(imgurl).path
     mime = mimetypes.guess_type(os.path.basename(path))
     if mime[0] is None:
@@ -83,6 +552,1148 @@ def guessImageType(imgurl):
         return mime[0]
 
 
+def decodeContent(content, encoding):
+    ''' 根据http响应头Content-Encoding的值解压缩响应内容，支持gzip和deflate '''
+
+    encoding = encoding.strip().lower()
+    if encoding in ["gzip", "x-gzip"]:
+        import gzip
+        return gzip.decompress(content)
+    if encoding == "deflate":
+        import zlib
+        # 有的服务器返回不带zlib头的deflate数据
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    return content
+
+
+# 匹配 <meta charset="..."> 及 <meta http-equiv="Content-Type" content="text/html; charset=...">
+_metaCharsetPattern = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_:.-]+)""", flags = re.IGNORECASE)
+# 检测网页编码时最多检查的字节数：从网页开头查找<meta charset>，从第一个非ASCII字节开始检查是否为utf-8
+charsetSniffSize = 4096
+_nonAsciiPattern = re.compile(rb"[\x80-\xff]")
+
+
+def _normalizeCharset(charset):
+    ''' 检查charset是否为python可以识别的编码，返回规范化的编码名称，无法识别时返回None
+        gb2312、gbk统一使用其超集gb18030进行解码
+    '''
+    try:
+        name = codecs.lookup(charset).name
+    except LookupError:
+        return None
+    if name in ["gb2312", "gbk"]:
+        return "gb18030"
+    return name
+
+
+def detectCharset(content, contentType = ""):
+    ''' 检测网页内容（bytes）的字符编码，返回编码名称
+
+        依次使用以下方式确定编码：
+            1. BOM
+            2. http响应头Content-Type中的charset
+            3. 网页开头charsetSniffSize个字节中的<meta charset>
+            4. 从第一个非ASCII字节开始的charsetSniffSize个字节可以按照utf-8解码时认为是utf-8，否则认为是gb18030，
+               全部为ASCII字节时认为是utf-8。网页开头较长的script、css等只含ASCII字节，不能用于判断编码
+    '''
+    for bom, charset in [(codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"),
+            (codecs.BOM_UTF16_BE, "utf-16")]:
+        if content.startswith(bom):
+            return charset
+
+    match = re.search(r"charset\s*=\s*[\"']?([^\s;\"']+)", contentType, flags = re.IGNORECASE)
+    if match is not None:
+        charset = _normalizeCharset(match.group(1))
+        if charset is not None:
+            return charset
+
+    head = content[:charsetSniffSize]
+
+    match = _metaCharsetPattern.search(head)
+    if match is not None:
+        charset = _normalizeCharset(match.group(1).decode('ascii'))
+        if charset is not None:
+            return charset
+
+    match = _nonAsciiPattern.search(content)
+    if match is None:
+        return "utf-8"
+    start = match.start()
+    sample = content[start:start + charsetSniffSize]
+
+    # 截断位置可能位于一个多字节字符中间，因此使用增量解码器，不要求最后的字节完整
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final = start + charsetSniffSize >= len(content))
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+
+def interleaveHosts(urls):
+    ''' 将urls按主机轮流排列，例如[a1, a2, a3, b1, b2]排列为[a1, b1, a2, b2, a3]，同一主机的url保持原来的顺序
+        并发抓取时各个主机的请求交替进行，不会因为某个主机达到并发数限制而占用所有的线程
+    '''
+
+    groups = dict()
+    for url in urls:
+        groups.setdefault(urllib.parse.urlsplit(url).hostname, []).append(url)
+    if len(groups) <= 1:
+        return list(urls)
+
+    result = []
+    for i in range(max(len(group) for group in groups.values())):
+        result.extend(group[i] for group in groups.values() if i < len(group))
+    return result
+
+
+# 服务器返回这些状态码时，认为是暂时的错误，可以重试
+retryStatuses = [500, 502, 503, 504]
+
+
+def backoffDelay(backoff, attempt):
+    ''' 返回第attempt次（从0开始）重试之前等待的秒数：backoff * 2^attempt，并随机减少至多一半，以免多个请求同时重试 '''
+
+    import random
+    return backoff * (2 ** attempt) * random.uniform(0.5, 1)
+
+
+def redirectUrl(url, location, status, headers):
+    ''' 返回重定向的目标地址，只允许重定向到http、https地址，否则抛出HTTPError，与urllib的处理相同
+        避免服务器通过重定向使程序读取file://等本地资源
+    '''
+
+    import urllib.error
+    target = urllib.parse.urljoin(url, location)
+    if urllib.parse.urlsplit(target).scheme.lower() not in ["http", "https"]:
+        raise urllib.error.HTTPError(url, status, "不允许重定向到：{}".format(target), headers, None)
+    return target
+
+
+def errorText(e):
+    ''' 返回抓取时发生的异常的说明文字 '''
+
+    import urllib.error
+    if isinstance(e, urllib.error.HTTPError):
+        return "HTTP {} {}".format(e.code, e.reason)
+    if isinstance(e, urllib.error.URLError):
+        reason = e.reason
+        if isinstance(reason, TimeoutError):
+            return "超时"
+        return str(reason)
+    return "{}: {}".format(type(e).__name__, e)
+
+
+class HostScheduler:
+    ''' 按主机调度http请求：限制每个主机的并发请求数及请求速率（令牌桶），遵守服务器返回的Retry-After，
+        可以在多个线程及asyncio中同时使用。不同主机的请求互不影响。
+
+        调用方式举例：
+            scheduler = HostScheduler(maxPerHost = 2, rate = 5)
+            pool = ConnectionPool(scheduler = scheduler)
+            article = Article(url = "http://www.example.com/12345.html", connectionPool = pool)
+    '''
+
+    # asyncio中等待并发数空闲时的轮询间隔（秒）
+    pollInterval = 0.05
+
+    def __init__(self, maxPerHost = 0, rate = 0, burst = 1, maxRetryAfter = 60):
+        ''' 参数说明：
+                maxPerHost      每个主机最多同时进行的请求数，0表示不限制
+                rate            每个主机每秒最多发送的请求数，可以为小数，0表示不限制
+                burst           令牌桶的容量，即空闲一段时间后最多可以连续发送的请求数
+                maxRetryAfter   服务器返回429、503并给出Retry-After时，等待时间不超过maxRetryAfter秒的请求会在等待后重试，
+                                等待期间暂停这个主机的所有请求；超过maxRetryAfter秒时不重试，只暂停maxRetryAfter秒
+        '''
+        if maxPerHost < 0 or rate < 0 or burst < 1 or maxRetryAfter < 0:
+            raise ValueError("HostScheduler参数值错误")
+
+        self.__maxPerHost = maxPerHost
+        self.__rate = rate
+        self.__burst = burst
+        self.__maxRetryAfter = maxRetryAfter
+        self.__hosts = dict()   # 主机 -> [进行中的请求数, 令牌数, 令牌更新时间, 暂停到的时间]
+        self.__cond = threading.Condition()
+
+
+    def __refill(self, state, now):
+        ''' 按经过的时间补充令牌 '''
+
+        if self.__rate > 0:
+            state[1] = min(self.__burst, state[1] + (now - state[2]) * self.__rate)
+        state[2] = now
+
+
+    def __tryAcquire(self, host):
+        ''' 尝试开始一个请求，成功时返回0，否则返回需要等待的秒数，达到并发数限制时返回None '''
+
+        now = time.monotonic()
+        state = self.__hosts.get(host)
+        if state is None:
+            state = self.__hosts[host] = [0, self.__burst, now, 0]
+
+        if self.__maxPerHost > 0 and state[0] >= self.__maxPerHost:
+            return None
+        if state[3] > now:
+            return state[3] - now
+
+        self.__refill(state, now)
+        if self.__rate > 0:
+            if state[1] < 1:
+                return (1 - state[1]) / self.__rate
+            state[1] -= 1
+        state[0] += 1
+        return 0
+
+
+    def __release(self, host):
+        ''' 结束一个请求，主机没有进行中的请求且状态已恢复初始值时删除记录 '''
+
+        with self.__cond:
+            now = time.monotonic()
+            state = self.__hosts[host]
+            state[0] -= 1
+            self.__refill(state, now)
+            if state[0] == 0 and state[1] >= self.__burst and state[3] <= now:
+                del self.__hosts[host]
+            self.__cond.notify_all()
+
+
+    @contextlib.contextmanager
+    def slot(self, host):
+        ''' 等待到可以向host发送请求，with语句块中进行请求 '''
+
+        with self.__cond:
+            while True:
+                wait = self.__tryAcquire(host)
+                if wait == 0:
+                    break
+                self.__cond.wait(wait)
+        try:
+            yield
+        finally:
+            self.__release(host)
+
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, host):
+        ''' slot()的异步版本，等待时不阻塞事件循环 '''
+
+        import asyncio
+        while True:
+            with self.__cond:
+                wait = self.__tryAcquire(host)
+            if wait == 0:
+                break
+            await asyncio.sleep(wait if wait is not None else self.pollInterval)
+        try:
+            yield
+        finally:
+            self.__release(host)
+
+
+    def retryAfter(self, host, value):
+        ''' 根据Retry-After响应头的值（秒数或http日期）暂停host的请求，
+            返回需要等待的秒数，没有Retry-After、格式错误或等待时间超过maxRetryAfter时返回None，此时不应重试
+        '''
+
+        if value is None:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            delay = int(value)
+        else:
+            import email.utils
+            try:
+                date = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if date.tzinfo is None:
+                return None
+            delay = max(0, date.timestamp() - time.time())
+
+        with self.__cond:
+            now = time.monotonic()
+            state = self.__hosts.get(host)
+            if state is None:
+                state = self.__hosts[host] = [0, self.__burst, now, 0]
+            state[3] = max(state[3], now + min(delay, self.__maxRetryAfter))
+        return delay if delay <= self.__maxRetryAfter else None
+
+
+class ConnectionPool:
+    ''' http连接池，对每个主机保持若干个keep-alive连接，在多次请求之间复用，可以在多个线程中同时使用
+
+        请求时发送Accept-Encoding，自动解压gzip、deflate格式的响应内容，自动跟随重定向。
+        如果设置了代理（环境变量http_proxy等），或者url不是http、https协议，使用urllib.request.urlopen进行请求。
+        如果设置了scheduler，每个请求都先由scheduler按主机调度，服务器返回429、503并给出Retry-After时等待后重试一次。
+        连接失败、超时等网络错误及服务器返回retryStatuses中的状态码时，等待一段时间后重试，最多重试retries次。
+
+        可能抛出的异常：
+            ValueError              url格式不正确
+            urllib.error.HTTPError  服务器返回4xx、5xx状态码
+            urllib.error.URLError   无法连接服务器等网络错误
+    '''
+
+    # 最多跟随的重定向次数
+    maxRedirects = 10
+
+    def __init__(self, maxIdle = 8, scheduler = None, connectTimeout = 10, readTimeout = 30, retries = 2,
+            backoff = 0.5, remoteOnly = False):
+        ''' 参数说明：
+                maxIdle     每个主机最多保留的空闲连接数
+                scheduler   HostScheduler对象，为None表示不限制请求的并发数及速率
+                connectTimeout 建立连接的超时时间（秒），为None表示不限制
+                readTimeout 等待服务器响应的超时时间（秒），每次读取数据时重新计时，为None表示不限制
+                retries     暂时的错误最多重试的次数，0表示不重试
+                backoff     第一次重试前等待的秒数，之后每次重试等待的时间加倍，见backoffDelay()
+                remoteOnly  是否只允许请求http、https地址，服务模式下使用，避免客户端通过url读取本地文件
+        '''
+        self.__remoteOnly = remoteOnly
+        self.__maxIdle = maxIdle
+        self.__scheduler = scheduler
+        self.__connectTimeout = connectTimeout
+        self.__readTimeout = readTimeout
+        self.__retries = max(0, retries)
+        self.__backoff = backoff
+        self.__idle = dict()    # (scheme, host, port) -> 空闲连接列表
+        self.__lock = threading.Lock()
+
+
+    def __slot(self, host):
+        ''' 返回向host发送请求时使用的上下文管理器 '''
+
+        if self.__scheduler is None or host is None:
+            return contextlib.nullcontext()
+        return self.__scheduler.slot(host)
+
+
+    def __connect(self, key):
+        ''' 从空闲连接中取出一个连接，没有空闲连接时新建连接，返回(连接, 是否为复用的连接) '''
+
+        with self.__lock:
+            idle = self.__idle.get(key)
+            if idle:
+                return (idle.pop(), True)
+
+        import http.client
+        scheme, host, port = key
+        if scheme == "https":
+            return (http.client.HTTPSConnection(host, port, timeout = self.__connectTimeout), False)
+        return (http.client.HTTPConnection(host, port, timeout = self.__connectTimeout), False)
+
+
+    def __release(self, key, conn):
+        ''' 将连接放回空闲连接列表 '''
+
+        with self.__lock:
+            idle = self.__idle.setdefault(key, [])
+            if len(idle) < self.__maxIdle:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+    def close(self):
+        ''' 关闭所有空闲连接 '''
+
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = dict()
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+    def __urlopen(self, url, headers):
+        ''' 使用urllib.request.urlopen进行请求，返回(状态码, 响应头, 响应内容) '''
+
+        import urllib.request
+        import urllib.error
+
+        # 可能会抛出ValueError异常：unknown url type
+        req = urllib.request.Request(url, headers = headers)
+        # urlopen只有一个超时时间，使用较长的一个
+        timeouts = [t for t in [self.__connectTimeout, self.__readTimeout] if t is not None]
+        kwargs = {"timeout": max(timeouts)} if len(timeouts) == 2 else {}
+        # 可能会抛出urllib.error.HTTPError异常
+        try:
+            with urllib.request.urlopen(req, **kwargs) as response:
+                return (response.status, response.headers, response.read())
+        except urllib.error.HTTPError as e:
+            # 条件请求返回的304不属于错误
+            if e.code == 304:
+                return (e.code, e.headers, b"")
+            raise
+
+
+    def __send(self, key, path, headers):
+        ''' 使用连接池中的连接发送GET请求，返回(状态码, 响应消息, 响应头, 响应内容) '''
+
+        import http.client
+        import urllib.error
+
+        while True:
+            conn, reused = self.__connect(key)
+            try:
+                if conn.sock is None:
+                    # 建立连接时使用connectTimeout，之后读取响应时使用readTimeout
+                    conn.connect()
+                    conn.sock.settimeout(self.__readTimeout)
+                conn.request("GET", path, headers = headers)
+                response = conn.getresponse()
+                content = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                # 复用的连接可能已经被服务器关闭，此时使用新的连接重试，超时则不再重试
+                if reused and not isinstance(e, TimeoutError):
+                    continue
+                raise urllib.error.URLError(e)
+
+            if response.will_close:
+                conn.close()
+            else:
+                self.__release(key, conn)
+            return (response.status, response.reason, response.headers, content)
+
+
+    def __sendRetry(self, key, path, headers):
+        ''' 调用__send()发送请求，网络错误及服务器返回retryStatuses中的状态码时等待后重试，最多重试self.__retries次
+            服务器给出Retry-After时不在这里重试，由request()交给scheduler处理
+        '''
+
+        import urllib.error
+
+        for attempt in range(self.__retries + 1):
+            try:
+                with self.__slot(key[1]):
+                    result = self.__send(key, path, headers)
+            except urllib.error.URLError:
+                if attempt >= self.__retries:
+                    raise
+            else:
+                status, _, respHeaders, _ = result
+                if attempt >= self.__retries or status not in retryStatuses or \
+                        respHeaders.get('Retry-After') is not None:
+                    return result
+            time.sleep(backoffDelay(self.__backoff, attempt))
+
+
+    def checkUrl(self, url):
+        ''' remoteOnly为True并且url不是http、https地址时抛出urllib.error.URLError '''
+
+        import urllib.error
+        if self.__remoteOnly and urllib.parse.urlsplit(url).scheme.lower() not in ["http", "https"]:
+            raise urllib.error.URLError("只允许请求http、https地址：{}".format(url))
+
+
+    def request(self, url, headers = None):
+        ''' 发送GET请求，返回(状态码, 响应头, 解压后的响应内容) '''
+
+        import urllib.request
+        import urllib.error
+
+        self.checkUrl(url)
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', "gzip, deflate")
+        retried = False
+
+        for _ in range(self.maxRedirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            scheme = parts.scheme.lower()
+
+            if scheme not in ["http", "https"] or parts.hostname is None or \
+                    (scheme in urllib.request.getproxies() and not urllib.request.proxy_bypass(parts.hostname)):
+                with self.__slot(parts.hostname):
+                    status, respHeaders, content = self.__urlopen(url, headers)
+                return (status, respHeaders, decodeContent(content, respHeaders.get('Content-Encoding', "")))
+
+            try:
+                key = (scheme, parts.hostname, parts.port)
+            except ValueError as e:
+                raise urllib.error.URLError(e)
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+            status, reason, respHeaders, content = self.__sendRetry(key, path, headers)
+
+            location = respHeaders.get('Location')
+            if status in [301, 302, 303, 307, 308] and location is not None:
+                url = redirectUrl(url, location, status, respHeaders)
+                continue
+            # 服务器要求稍后重试，由scheduler暂停这个主机的请求，然后重试一次
+            if status in [429, 503] and self.__scheduler is not None and not retried:
+                if self.__scheduler.retryAfter(parts.hostname, respHeaders.get('Retry-After')) is not None:
+                    retried = True
+                    continue
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, reason, respHeaders, None)
+
+            return (status, respHeaders, decodeContent(content, respHeaders.get('Content-Encoding', "")))
+
+        raise urllib.error.URLError("重定向次数过多：{}".format(url))
+
+
+# 默认的连接池，未指定connectionPool的Article对象共用这个连接池
+defaultConnectionPool = ConnectionPool()
+
+
+class AsyncConnectionPool:
+    ''' 基于asyncio streams的http连接池，用法与ConnectionPool相同，request()为协程，
+        对每个主机保持若干个keep-alive连接，只能在一个事件循环（线程）中使用，事件循环改变时丢弃原有的空闲连接。
+
+        请求时发送Accept-Encoding，自动解压gzip、deflate格式的响应内容，自动跟随重定向。
+        如果设置了代理（环境变量http_proxy等），或者url不是http、https协议，在线程池中使用同步的连接池进行请求，见request()。
+        设置了scheduler时的处理、超时及重试与ConnectionPool相同，等待时不阻塞事件循环。
+
+        可能抛出的异常与ConnectionPool相同。
+    '''
+
+    # 最多跟随的重定向次数
+    maxRedirects = 10
+
+    def __init__(self, maxIdle = 8, scheduler = None, connectTimeout = 10, readTimeout = 30, retries = 2,
+            backoff = 0.5):
+        ''' 参数说明见ConnectionPool '''
+        self.__maxIdle = maxIdle
+        self.__scheduler = scheduler
+        self.__connectTimeout = connectTimeout
+        self.__readTimeout = readTimeout
+        self.__retries = max(0, retries)
+        self.__backoff = backoff
+        self.__idle = dict()    # (scheme, host, port) -> 空闲连接列表，每项为(reader, writer)
+        self.__loop = None      # 空闲连接所属的事件循环
+
+
+    def __slot(self, host):
+        ''' 返回向host发送请求时使用的异步上下文管理器 '''
+
+        if self.__scheduler is None or host is None:
+            return contextlib.nullcontext()
+        return self.__scheduler.aslot(host)
+
+
+    def __idleConnections(self, key):
+        ''' 返回key对应的空闲连接列表 '''
+
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if loop is not self.__loop:
+            # 其他事件循环中建立的连接不能在当前事件循环中使用
+            self.__idle = dict()
+            self.__loop = loop
+        return self.__idle.setdefault(key, [])
+
+
+    async def __connect(self, key):
+        ''' 从空闲连接中取出一个连接，没有空闲连接时新建连接，返回(reader, writer, 是否为复用的连接) '''
+
+        idle = self.__idleConnections(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return (reader, writer, True)
+            writer.close()
+
+        import asyncio
+        scheme, host, port = key
+        if scheme == "https":
+            import ssl
+            connect = asyncio.open_connection(host, port or 443, ssl = ssl.create_default_context())
+        else:
+            connect = asyncio.open_connection(host, port or 80)
+        reader, writer = await asyncio.wait_for(connect, self.__connectTimeout)
+        return (reader, writer, False)
+
+
+    def __release(self, key, reader, writer):
+        ''' 将连接放回空闲连接列表 '''
+
+        idle = self.__idleConnections(key)
+        if len(idle) < self.__maxIdle:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+
+    async def aclose(self):
+        ''' 关闭所有空闲连接 '''
+
+        idle = self.__idle
+        self.__idle = dict()
+        for conns in idle.values():
+            for _, writer in conns:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+
+    async def __readResponse(self, reader):
+        ''' 读取一个响应，返回(状态码, 响应消息, 响应头, 响应内容, 是否需要关闭连接) '''
+
+        import io
+        import asyncio
+        import http.client
+
+        # 每次读取数据时重新计时
+        def read(awaitable):
+            return asyncio.wait_for(awaitable, self.__readTimeout)
+
+        while True:
+            line = await read(reader.readline())
+            if not line:
+                raise ConnectionError("服务器关闭了连接")
+            version, status, reason = (line.decode('latin-1').rstrip("\r\n").split(None, 2) + [""])[:3]
+            if not version.startswith("HTTP/"):
+                raise http.client.BadStatusLine(line)
+            status = int(status)
+
+            lines = []
+            while True:
+                line = await read(reader.readline())
+                if not line or line in [b"\r\n", b"\n"]:
+                    break
+                lines.append(line)
+            respHeaders = http.client.parse_headers(io.BytesIO(b"".join(lines) + b"\r\n"))
+
+            # 跳过100 Continue等临时响应
+            if status >= 200 or status == 101:
+                break
+
+        connection = respHeaders.get('Connection', "").lower()
+        willClose = "close" in connection or (version == "HTTP/1.0" and "keep-alive" not in connection)
+
+        if status in [204, 304] or status < 200:
+            content = b""
+        elif "chunked" in respHeaders.get('Transfer-Encoding', "").lower():
+            chunks = []
+            while True:
+                size = int((await read(reader.readline())).split(b";", 1)[0].strip(), 16)
+                if size == 0:
+                    break
+                chunks.append(await read(reader.readexactly(size)))
+                await read(reader.readline())
+            # 跳过trailer
+            while (await read(reader.readline())) not in [b"\r\n", b"\n", b""]:
+                pass
+            content = b"".join(chunks)
+        elif respHeaders.get('Content-Length') is not None:
+            content = await read(reader.readexactly(int(respHeaders.get('Content-Length'))))
+        else:
+            chunks = []
+            while True:
+                chunk = await read(reader.read(65536))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            content = b"".join(chunks)
+            willClose = True
+
+        return (status, reason, respHeaders, content, willClose)
+
+
+    async def __send(self, key, host, path, headers):
+        ''' 使用连接池中的连接发送GET请求，返回(状态码, 响应消息, 响应头, 响应内容) '''
+
+        import asyncio
+        import http.client
+        import urllib.error
+
+        request = "GET {} HTTP/1.1\r\nHost: {}\r\n".format(path, host)
+        request += "".join("{}: {}\r\n".format(name, value) for name, value in headers.items())
+        request = (request + "\r\n").encode('latin-1')
+
+        while True:
+            try:
+                reader, writer, reused = await self.__connect(key)
+            except (OSError, asyncio.TimeoutError) as e:
+                raise urllib.error.URLError(e)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, reason, respHeaders, content, willClose = await self.__readResponse(reader)
+            except (http.client.HTTPException, OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+                writer.close()
+                # 复用的连接可能已经被服务器关闭，此时使用新的连接重试，超时则不再重试
+                if reused and not isinstance(e, (TimeoutError, asyncio.TimeoutError)):
+                    continue
+                raise urllib.error.URLError(e)
+            except asyncio.CancelledError:
+                # 响应没有读取完，连接不能再使用
+                writer.close()
+                raise
+
+            if willClose:
+                writer.close()
+            else:
+                self.__release(key, reader, writer)
+            return (status, reason, respHeaders, content)
+
+
+    async def __sendRetry(self, key, host, path, headers):
+        ''' 调用__send()发送请求，失败时等待后重试，见ConnectionPool.__sendRetry() '''
+
+        import asyncio
+        import urllib.error
+
+        for attempt in range(self.__retries + 1):
+            try:
+                async with self.__slot(key[1]):
+                    result = await self.__send(key, host, path, headers)
+            except urllib.error.URLError:
+                if attempt >= self.__retries:
+                    raise
+            else:
+                status, _, respHeaders, _ = result
+                if attempt >= self.__retries or status not in retryStatuses or \
+                        respHeaders.get('Retry-After') is not None:
+                    return result
+            await asyncio.sleep(backoffDelay(self.__backoff, attempt))
+
+
+    async def request(self, url, headers = None, syncPool = None):
+        ''' 发送GET请求，返回(状态码, 响应头, 解压后的响应内容)
+
+            syncPool为设置了代理或者url不是http、https协议时在线程池中使用的ConnectionPool对象，
+            其scheduler、超时、重试及remoteOnly等设置对这些请求生效；为None或defaultConnectionPool时
+            使用defaultConnectionPool，并由self的scheduler进行调度
+        '''
+
+        import asyncio
+        import urllib.request
+        import urllib.error
+
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', "gzip, deflate")
+        retried = False
+
+        for _ in range(self.maxRedirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            scheme = parts.scheme.lower()
+
+            if scheme not in ["http", "https"] or parts.hostname is None or \
+                    (scheme in urllib.request.getproxies() and not urllib.request.proxy_bypass(parts.hostname)):
+                loop = asyncio.get_running_loop()
+                if syncPool is not None and syncPool is not defaultConnectionPool:
+                    # 由syncPool自身的scheduler调度，这里不再占用并发数，以免同一个请求计算两次
+                    return await loop.run_in_executor(None, syncPool.request, url, headers)
+                async with self.__slot(parts.hostname):
+                    return await loop.run_in_executor(None, defaultConnectionPool.request, url, headers)
+
+            try:
+                key = (scheme, parts.hostname, parts.port)
+            except ValueError as e:
+                raise urllib.error.URLError(e)
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+            host = parts.netloc.rpartition("@")[2]
+            status, reason, respHeaders, content = await self.__sendRetry(key, host, path, headers)
+
+            location = respHeaders.get('Location')
+            if status in [301, 302, 303, 307, 308] and location is not None:
+                url = redirectUrl(url, location, status, respHeaders)
+                continue
+            # 服务器要求稍后重试，由scheduler暂停这个主机的请求，然后重试一次
+            if status in [429, 503] and self.__scheduler is not None and not retried:
+                if self.__scheduler.retryAfter(parts.hostname, respHeaders.get('Retry-After')) is not None:
+                    retried = True
+                    continue
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, reason, respHeaders, None)
+
+            return (status, respHeaders, decodeContent(content, respHeaders.get('Content-Encoding', "")))
+
+        raise urllib.error.URLError("重定向次数过多：{}".format(url))
+
+
+# 默认的异步连接池，未指定asyncConnectionPool的Article对象共用这个连接池
+defaultAsyncConnectionPool = AsyncConnectionPool()
+
+
+class DiskCache:
+    ''' 本地磁盘缓存，以url为键，内容按照sha256值保存（相同的内容只保存一份）
+
+        目录结构：
+            <path>/index.json               索引文件，记录url对应内容的sha256值、保存时间、最后访问时间等
+            <path>/objects/<xx>/<sha256>    缓存内容，xx为sha256值的前两位
+
+        缓存总大小超过maxSize时，按照最后访问时间删除最久未使用的条目（LRU）。
+        如果maxAge大于0，保存时间超过maxAge秒的条目视为过期。
+        可以在多个线程中同时使用同一个缓存对象。写入的条目在调用flush()后才会保存到索引文件。
+    '''
+
+    def __init__(self, path, maxSize = 500 * 1024 * 1024, maxAge = 0):
+        ''' 参数说明：
+                path        缓存目录，不存在时自动创建
+                maxSize     缓存的最大字节数，默认为500MB
+                maxAge      缓存条目的有效期（秒），0表示永不过期
+        '''
+        self.__path = os.path.abspath(os.path.expanduser(path))
+        self.__maxSize = maxSize
+        self.__maxAge = maxAge
+        self.__lock = threading.Lock()
+        self.__dirty = False
+
+        os.makedirs(os.path.join(self.__path, "objects"), exist_ok = True)
+        # url -> {"hash": sha256值, "size": 字节数, "time": 保存时间, "atime": 最后访问时间}
+        self.__index = self.__loadIndex()
+
+
+    def __indexPath(self):
+        return os.path.join(self.__path, "index.json")
+
+
+    def __objectPath(self, digest):
+        return os.path.join(self.__path, "objects", digest[:2], digest)
+
+
+    def __loadIndex(self):
+        try:
+            with open(self.__indexPath(), encoding = 'utf-8') as f:
+                index = json.load(f)
+            if isinstance(index, dict):
+                return index
+        except (IOError, ValueError):
+            pass
+        return dict()
+
+
+    def get(self, url, ignoreAge = False):
+        ''' 读取url对应的缓存内容（bytes），没有缓存或已过期时返回None
+            如果ignoreAge为True，即使条目已过期也返回缓存内容
+        '''
+
+        with self.__lock:
+            entry = self.__index.get(url)
+            if entry is None:
+                return None
+            if not ignoreAge and self.__maxAge > 0 and time.time() - entry["time"] > self.__maxAge:
+                return None
+            try:
+                with open(self.__objectPath(entry["hash"]), mode = 'rb') as f:
+                    content = f.read()
+            except IOError:
+                del self.__index[url]
+                self.__dirty = True
+                return None
+            entry["atime"] = time.time()
+            self.__dirty = True
+            return content
+
+
+    def getMeta(self, url):
+        ''' 返回写入url对应的缓存时保存的附加信息（字典），没有缓存时返回None '''
+
+        with self.__lock:
+            entry = self.__index.get(url)
+            if entry is None:
+                return None
+            return entry.get("meta", dict())
+
+
+    def put(self, url, content, meta = None):
+        ''' 将url对应的内容（bytes）写入缓存，写入后如果超过缓存大小，删除最久未使用的条目
+            meta为需要一并保存的附加信息（字典），可以通过getMeta()读取
+        '''
+
+        import hashlib
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.__objectPath(digest)
+
+        with self.__lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok = True)
+                tmp = "{}.{}.tmp".format(path, threading.get_ident())
+                with open(tmp, mode = 'wb') as f:
+                    f.write(content)
+                os.replace(tmp, path)
+
+            now = time.time()
+            old = self.__index.get(url)
+            self.__index[url] = {"hash": digest, "size": len(content), "time": now, "atime": now,
+                    "meta": meta or dict()}
+            self.__dirty = True
+            # 覆盖内容已改变的条目时，没有其他url引用原来的文件则删除，否则文件不再被索引记录，也不计入缓存大小
+            if old is not None and old["hash"] != digest and \
+                    all(entry["hash"] != old["hash"] for entry in self.__index.values()):
+                try:
+                    os.remove(self.__objectPath(old["hash"]))
+                except OSError:
+                    pass
+            self.__evict()
+
+
+    def __evict(self):
+        ''' 删除最久未使用的条目，直到缓存大小不超过self.__maxSize，调用前需要持有self.__lock '''
+
+        sizes = dict()
+        for entry in self.__index.values():
+            sizes[entry["hash"]] = entry["size"]
+        total = sum(sizes.values())
+        if total <= self.__maxSize:
+            return
+
+        refs = dict()
+        for entry in self.__index.values():
+            refs[entry["hash"]] = refs.get(entry["hash"], 0) + 1
+
+        for url in sorted(self.__index, key = lambda u: self.__index[u]["atime"]):
+            if total <= self.__maxSize:
+                break
+            digest = self.__index.pop(url)["hash"]
+            refs[digest] -= 1
+            # 没有其他url引用这个文件时，删除文件
+            if refs[digest] == 0:
+                total -= sizes[digest]
+                try:
+                    os.remove(self.__objectPath(digest))
+                except OSError:
+                    pass
+
+
+    def flush(self):
+        ''' 将索引写入磁盘，写入前与磁盘上的索引合并，以免覆盖其他进程写入的条目 '''
+
+        with self.__lock:
+            if not self.__dirty:
+                return
+            for url, entry in self.__loadIndex().items():
+                current = self.__index.get(url)
+                if current is None or current["atime"] < entry["atime"]:
+                    if os.path.exists(self.__objectPath(entry["hash"])):
+                        self.__index[url] = entry
+            self.__evict()
+
+            tmp = "{}.{}.tmp".format(self.__indexPath(), os.getpid())
+            with open(tmp, mode = 'wt', encoding = 'utf-8') as f:
+                json.dump(self.__index, f)
+            os.replace(tmp, self.__indexPath())
+            self.__dirty = False
+
+
+class ImageCache(DiskCache):
+    ''' 图片的本地磁盘缓存，以图片url为键，缓存的内容为图片数据，参数说明见DiskCache
+
+        调用方式举例：
+            cache = ImageCache("~/.cache/pyxygen/images")
+            article = Article(url = "http://www.example.com/12345.html", imageCache = cache)
+            ...
+            cache.flush()
+    '''
+    pass
+
+
+class HttpCache(DiskCache):
+    ''' 网页的http响应缓存，保存网页内容及ETag、Last-Modified，参数说明见DiskCache
+
+        再次抓取网页时发送If-None-Match、If-Modified-Since，服务器返回304时从缓存读取网页内容。
+        如果refresh为True，不发送上述请求头，总是重新下载网页并更新缓存。
+
+        调用方式举例：
+            cache = HttpCache("~/.cache/pyxygen/pages")
+            article = Article(url = "http://www.example.com/12345.html", httpCache = cache)
+            article.fetchPage()
+            ...
+            cache.flush()
+    '''
+
+    def __init__(self, path, maxSize = 100 * 1024 * 1024, maxAge = 0, refresh = False):
+        ''' 参数说明：
+                path        缓存目录，不存在时自动创建
+                maxSize     缓存的最大字节数，默认为100MB
+                maxAge      大于0时，保存时间未超过maxAge秒的网页直接从缓存读取，不发送请求
+                refresh     是否忽略缓存，总是重新下载网页
+        '''
+        super().__init__(path, maxSize, maxAge)
+        self.maxAge = maxAge
+        self.refresh = refresh
+
+
+    def lookup(self, url):
+        ''' 返回未过期的网页内容，需要向服务器发送请求时返回None '''
+
+        if self.refresh or self.maxAge <= 0:
+            return None
+        return self.get(url)
+
+
+    def validators(self, url):
+        ''' 返回进行条件请求时需要添加的请求头（字典），没有缓存时返回空字典 '''
+
+        headers = dict()
+        if self.refresh:
+            return headers
+
+        meta = self.getMeta(url)
+        if meta is None:
+            return headers
+        if meta.get("etag"):
+            headers['If-None-Match'] = meta["etag"]
+        if meta.get("lastModified"):
+            headers['If-Modified-Since'] = meta["lastModified"]
+        return headers
+
+
+    def store(self, url, respHeaders, content):
+        ''' 保存网页内容，响应头中没有ETag和Last-Modified时不保存 '''
+
+        etag = respHeaders.get('ETag')
+        lastModified = respHeaders.get('Last-Modified')
+        if etag is None and lastModified is None:
+            return
+        self.put(url, content, {"etag": etag, "lastModified": lastModified,
+                "contentType": respHeaders.get('Content-Type', "")})
+
+
+class ResultCache(DiskCache):
+    ''' 正文提取结果的本地磁盘缓存，键为输入html的sha256值、url及所有影响输出的参数的sha256值，见makeKey()
+
+        相同的html（例如重复的stdin输入、镜像网页、中断后重新运行）使用相同的参数再次提取时，
+        直接返回保存的正文，不再进行解析及字数统计。参数说明见DiskCache。
+
+        调用方式举例：
+            cache = ResultCache("~/.cache/pyxygen/results")
+            article = Article(html = html, resultCache = cache)
+            article.preprocess()
+            print(article.article())
+            cache.flush()
+    '''
+
+    # 正文提取的算法改变时修改此值，使以前的缓存失效
+    version = 1
+
+    def __init__(self, path, maxSize = 100 * 1024 * 1024, maxAge = 0):
+        super().__init__(path, maxSize, maxAge)
+
+
+    @classmethod
+    def makeKey(cls, htmlDigest, url, options):
+        ''' 返回缓存的键，htmlDigest为输入html的sha256值，options为影响输出的参数（字典，值可以转换为json） '''
+
+        import hashlib
+        key = json.dumps([cls.version, htmlDigest, url, options], sort_keys = True, ensure_ascii = False)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+    def lookup(self, key):
+        ''' 返回(标题, 正文)，没有缓存时返回None '''
+
+        content = self.get(key)
+        if content is None:
+            return None
+        meta = self.getMeta(key) or dict()
+        return (meta.get("title", ""), content.decode('utf-8'))
+
+
+    def store(self, key, title, html):
+        ''' 保存标题及正文 '''
+
+        self.put(key, html.encode('utf-8'), {"title": title})
+
+
+class ImageProcessor:
+    ''' 在转换为inline image之前缩小、重新压缩图片，并去除exif等元数据，需要安装Pillow
+
+        处理在Article抓取图片的线程池中进行，Pillow在解码、缩放、编码时会释放GIL，多个图片可以同时处理。
+        动画图片、无法识别的图片以及处理后体积没有减小且不需要缩放的图片保持原样。
+
+        调用方式举例：
+            processor = ImageProcessor(maxWidth = 1200, maxHeight = 1600, quality = 75)
+            article = Article(url = "http://www.example.com/12345.html", iimage = True, imageProcessor = processor)
+
+        没有安装Pillow时，创建对象时抛出ImportError异常
+    '''
+
+    # 支持输出的图片格式
+    formats = ["JPEG", "PNG", "WEBP"]
+
+    def __init__(self, maxWidth = 0, maxHeight = 0, quality = 85, format = None):
+        ''' 参数说明：
+                maxWidth    图片的最大宽度，超过时按比例缩小，0表示不限制
+                maxHeight   图片的最大高度，超过时按比例缩小，0表示不限制
+                quality     JPEG、WEBP格式的压缩质量，1-95
+                format      输出的图片格式，可以为jpeg、png、webp，为None表示保持原来的格式
+
+            参数值不正确时抛出ValueError异常
+        '''
+
+        import PIL.Image
+
+        if maxWidth < 0 or maxHeight < 0:
+            raise ValueError("图片尺寸不能为负数")
+        if not 1 <= quality <= 95:
+            raise ValueError("图片压缩质量应为1-95")
+        if format is not None:
+            format = format.upper()
+            if format == "JPG":
+                format = "JPEG"
+            if format not in self.formats:
+                raise ValueError("不支持的图片格式：{}，可以使用：{}".format(format, "、".join(self.formats)))
+
+        self.maxWidth = maxWidth
+        self.maxHeight = maxHeight
+        self.quality = quality
+        self.format = format
+
+
+    def process(self, content):
+        ''' 处理图片数据（bytes），返回(处理后的图片数据, 图片格式)，图片保持原样时返回(content, None) '''
+
+        import io
+        import PIL.Image
+        import PIL.ImageOps
+
+        try:
+            img = PIL.Image.open(io.BytesIO(content))
+            if getattr(img, "n_frames", 1) > 1:
+                return (content, None)
+            original = img.format
+            format = self.format or original
+            if format not in self.formats:
+                return (content, None)
+
+            # 去除元数据之前，按照exif中的方向旋转图片
+            img = PIL.ImageOps.exif_transpose(img)
+            resized = False
+            if self.maxWidth > 0 or self.maxHeight > 0:
+                size = (self.maxWidth or img.width, self.maxHeight or img.height)
+                if img.width > size[0] or img.height > size[1]:
+                    img.thumbnail(size, PIL.Image.LANCZOS)
+                    resized = True
+
+            if format == "JPEG" and img.mode not in ["RGB", "L"]:
+                # JPEG不支持透明，透明部分使用白色背景
+                img = img.convert("RGBA")
+                background = PIL.Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask = img.getchannel("A"))
+                img = background
+
+            out = io.BytesIO()
+            if format == "PNG":
+                img.save(out, format = format, optimize = True)
+            else:
+                img.save(out, format = format, quality = self.quality)
+        except (OSError, ValueError, PIL.Image.DecompressionBombError):
+            return (content, None)
+
+        result = out.getvalue()
+        if not resized and format == original and len(result) >= len(content):
+            return (content, None)
+        return (result, format)
+
+
+def parseImageSize(size):
+    ''' 将<宽>x<高>或<宽>格式的字符串转换为(宽, 高)，只给出宽度时高度为0（不限制），格式错误时抛出ValueError异常 '''
+
+    width, _, height = size.lower().partition("x")
+    width = int(width)
+    height = int(height) if height != "" else 0
+    if width <= 0 or height < 0:
+        raise ValueError("图片尺寸只能为正整数：{}".format(size))
+    return (width, height)
+
+
 def usage():
 
     s = '''Html Article - 网页正文提取程序
@@ -99,24 +1710,75 @@ def usage():
     -c, --cookie <cookie>   设置 cookie
         --rows <n>          设置统计字数的行数，默认为10，表示统计当前行及上下10行，共计21行的字数
         --chars <n>         设置统计字数阈值，默认为60，表示当字数大于等于60时，判断为正文
+        --autotune          自动选择rows、chars，不可与--rows、--chars参数同时使用
+        --sweep             不输出正文，以json格式输出多组rows、chars的统计结果，用于选择合适的参数
     -i, --inline            将网页中的图片使用base64编码转换为inline image嵌入到html中
+        --imageworkers <n>  设置并发抓取图片的线程数，默认为8
+        --imagecache <dir>  设置图片缓存目录，抓取图片时优先从缓存读取，未命中时抓取并写入缓存
+        --imagesize <w[xh]> 转换inline image时缩小超过此尺寸的图片，例如1200x1600，只给出宽度时不限制高度
+        --imagequality <n>  转换inline image时重新压缩图片，JPEG、WEBP的压缩质量为1-95，默认为85
+        --imageformat <fmt> 转换inline image时将图片转换为jpeg、png或webp格式，默认保持原来的格式
+                            以上三个参数需要安装Pillow，处理后的图片去除了exif等元数据
+        --httpcache <dir>   设置网页缓存目录，网页未修改时（服务器返回304）从缓存读取网页
+        --httpcachesize <n> 设置网页缓存的最大容量（MB），默认为100
+        --refresh           不使用网页缓存中的内容，重新下载网页并更新缓存
+        --resultcache <dir> 设置正文缓存目录，html及影响输出的参数都相同时，直接输出缓存的正文，
+                            不能与--pages同时使用
+        --resultcachesize <n> 设置正文缓存的最大容量（MB），默认为100
+        --hostconcurrency <n> 限制对同一主机同时进行的请求数，默认不限制
+        --hostrate <r>      限制对同一主机每秒发送的请求数，可以为小数，例如0.5，默认不限制
+                            服务器返回429、503并给出不超过60秒的Retry-After时，暂停对该主机的请求，等待后重试
+        --connecttimeout <s> 设置建立连接的超时时间（秒），默认为10
+        --readtimeout <s>   设置等待服务器响应的超时时间（秒），默认为30
+        --retries <n>       连接失败、超时或服务器返回5xx时最多重试的次数，默认为2，0表示不重试
+        --hedge <s>         抓取图片超过s秒未完成时，再发送一个相同的请求，使用先完成的结果，默认不发送
     -t, --title             在正文顶部添加文章标题
     -s, --source            在正文顶部添加原文地址（对于从stdin读取的html无效）
     -n                      不使用统计字数的方式确定正文位置
+        --pages <n>         文章分为多页时，查找并合并其他分页，最多合并n页（包括第一页），默认为1，表示不合并
+        --pagepattern <re>  分页链接的url格式（正则表达式，第一个分组为页码，不是数字时忽略该链接），可以使用多次，
+                            默认识别rel="next"及?page=2、/page/2、_2.html格式的链接
     -p, --prettify          将输出的html代码进行格式化以方便阅读代码
+        --parser <name>     设置html解析器，可以为lxml、html.parser、html5lib，默认使用可用的最快的解析器
+        --engine <name>     确定正文位置的方法，lines（默认）按行统计字数，依赖网页源码的换行；
+                            dom对解析树中的区块打分，适合压缩成一行的网页，不使用--rows、--chars
+        --stats             将各处理阶段的耗时、数据量以json格式输出到stderr
+        --tracememory       同--stats，并统计各阶段的内存峰值（速度较慢）
+                            --stats、--tracememory只用于处理单个网页，不能与-b、--serve参数同时使用
     -o, --output <filename> 输出到文件，而不是stdout，不可与-a参数同时使用
     -a, --autonaming        输出文件到当前目录，文件名根据网页title进行设置，不可与-o参数同时使用
     -h, --help              显示帮助
 
+批量处理参数：
+    -b, --batch <file>      批量处理文件中列出的url或本地html文件，每行一个，文件名为-时从stdin读取
+    -d, --outdir <dir>      批量处理时的输出目录，默认为当前目录，目录中会生成manifest.json记录处理结果
+        --workers <n>       批量处理时的工作进程数，默认为cpu个数
+        --maxtasks <n>      每个工作进程处理n个项目后重新创建，默认为50
+                            批量处理时，--hostconcurrency、--hostrate的限制由各工作进程平分
+                            设置了--hostconcurrency时，工作进程数不超过其参数值
+
+服务模式参数：
+        --serve             以http服务的方式运行，接收url或html，返回提取的正文
+        --listen <addr>     服务监听的地址，格式为[host:]port，默认为127.0.0.1:8000
+        --workers <n>       服务模式下处理请求的线程数，默认为8
+
 可以直接抓取网页，或通过stdin读取html：
     htmlarticle.py http://www.example.com/12345.html
-    cat example.html | htmlarticle.py'''
+    cat example.html | htmlarticle.py
+
+批量处理：
+    htmlarticle.py -b urls.txt -d out --workers 8
+
+服务模式：
+    htmlarticle.py --serve --listen 8000
+    curl 'http://127.0.0.1:8000/?url=http://www.example.com/12345.html'
+    curl -d '{"html": "<html>...</html>", "rows": 5}' http://127.0.0.1:8000/'''
 
     print(s)
 
 
-def createFilename(title):
-    '根据title生成文件名'
+def createFilename(title, dirname = ""):
+    ''' 根据title生成文件名，dirname为文件所在的目录，默认为当前目录 '''
 
     # 去除特殊符号
     signs = r'''!@#$%^&*+=|<>?"':;[]{}'''+'\r\n'
@@ -136,10 +1798,10 @@ def createFilename(title):
 
     basename = "{}.html".format(title)
 
-    # 检测当前目录下是否存在同名文件，如果有，则进行修改
+    # 检测目录下是否存在同名文件，如果有，则进行修改
     n = 0
     while True:
-        if os.path.exists(basename):
+        if os.path.exists(os.path.join(dirname, basename)):
             n += 1
             basename = "{}{}.html".format(title, n)
         else:
@@ -148,10 +1810,86 @@ def createFilename(title):
     return basename
 
 
+class ArticleStats:
+    ''' Article各阶段的耗时、数据量及内存峰值
+
+        阶段名称：
+            fetch       抓取网页，bytes为下载的字节数
+            parse       解析网页，bytes为网页html的字符数
+            clean       提取标题、清理body，engine为dom时包括对区块打分（见scoreBlocks()），bytes为清理后body的字符数
+            density     统计字数确定正文位置，bytes为正文html的字符数
+            pages       抓取并预处理其他分页，bytes为其他分页html的字符数之和
+            sweep       Article.sweep()统计多组rows、chars，bytes为body的字符数
+            serialize   去除空标签并生成最终的html，bytes为不含图片data uri的html的字符数
+            inline      抓取图片用于转换为inline image，bytes为插入html的data uri的字符数
+            cache       从结果缓存读取正文（见ResultCache），bytes为正文的字符数
+
+        每个阶段记录为字典：{"seconds": 耗时, "bytes": 数据量, "peak": 内存峰值, "count": 运行次数}，
+        同一阶段运行多次时，耗时、数据量累加，内存峰值取最大值。未开启内存统计时peak为None。
+
+        fetches记录每个网页、图片的抓取结果，每项为字典：
+            {"url": url, "type": "page"或"image", "seconds": 耗时, "bytes": 下载的字节数,
+             "cached": 是否从图片缓存读取, "hedged": 是否发送了重复请求, "error": 出错原因，成功时为None}
+        抓取失败的图片不会嵌入到正文中，可以通过failedFetches()查看原因。
+    '''
+
+    def __init__(self):
+        self.phases = dict()
+        self.fetches = []
+
+
+    def add(self, name, seconds, nbytes, peak = None):
+        ''' 记录一次阶段运行的结果 '''
+
+        record = self.phases.setdefault(name, {"seconds": 0.0, "bytes": 0, "peak": None, "count": 0})
+        record["seconds"] += seconds
+        record["bytes"] += nbytes
+        record["count"] += 1
+        if peak is not None:
+            record["peak"] = peak if record["peak"] is None else max(record["peak"], peak)
+
+
+    def addFetch(self, url, kind, seconds, nbytes = 0, error = None, cached = False, hedged = False):
+        ''' 记录一次网页或图片的抓取结果，kind为"page"或"image" '''
+
+        self.fetches.append({"url": url, "type": kind, "seconds": round(seconds, 3), "bytes": nbytes,
+            "cached": cached, "hedged": hedged, "error": error})
+
+
+    def failedFetches(self):
+        ''' 返回抓取失败的记录 '''
+        return [record for record in self.fetches if record["error"] is not None]
+
+
+    def total(self):
+        ''' 返回所有阶段的总耗时（秒）'''
+        return sum(record["seconds"] for record in self.phases.values())
+
+
+    def toDict(self):
+        return {"phases": self.phases, "seconds": self.total(), "fetches": self.fetches}
+
+
+    def toJson(self):
+        return json.dumps(self.toDict(), ensure_ascii = False)
+
+
 class Article:
 
+    # 批量处理时会创建大量Article对象，使用__slots__减少每个对象占用的内存
+    __slots__ = ("__html", "__htmlLength", "__url", "__rows", "__chars", "__useragent", "__cookie", "__iimage",
+        "__noCharsStat", "__withTitle", "__withSource", "__prettify", "__imageWorkers", "__hedgeDelay",
+        "__imageCache", "__imageProcessor", "__maxPages", "__pagePatterns", "__pageWorkers", "__pageLinks",
+        "__pages", "__connectionPool", "__asyncConnectionPool", "__httpCache", "__resultCache", "__htmlDigest",
+        "__deferred", "__parser", "__engine", "__lowMemory", "__stats", "__statsHook", "__traceMemory",
+        "__fetchedBytes", "__base", "__title", "__body", "__domBody", "__bodylines", "__linechars", "__linestats")
+
     def __init__(self, *, html = "", url = "", rows = 0, chars = 0, useragent = "", cookie = "", 
-            iimage = True, noCharsStat = False, withTitle = True, withSource = True, prettify = False):
+            iimage = True, noCharsStat = False, withTitle = True, withSource = True, prettify = False,
+            imageWorkers = 8, imageCache = None, connectionPool = None, httpCache = None, parser = None,
+            statsHook = None, traceMemory = False, imageProcessor = None, maxPages = 1, pagePatterns = None,
+            pageWorkers = 4, asyncConnectionPool = None, hedgeDelay = 0, resultCache = None, lowMemory = False,
+            engine = "lines"):
         ''' 因为参数较多，未避免输入出错，因此全部参数均为keyword argument
 
             参数说明：
@@ -167,6 +1905,30 @@ class Article:
                 withTitle   是否在输出的正文中添加标题
                 withSource  是否在输出的正文中添加原文地址
                 prettify    是否将输出的html代码进行格式化以方便阅读代码
+                imageWorkers 转换inline image时，并发抓取图片的线程数，默认为8
+                hedgeDelay  抓取图片超过hedgeDelay秒仍未完成时，再发送一个相同的请求，使用先完成的结果，
+                            可以减少个别响应慢的请求造成的等待，默认为0，表示不发送重复请求
+                imageCache  ImageCache对象，抓取图片时优先从缓存读取，为None表示不使用缓存
+                imageProcessor ImageProcessor对象，转换inline image之前缩小、重新压缩图片，为None表示不处理
+                maxPages    文章分为多页时，最多合并的页数（包括第一页），默认为1，表示不查找其他分页
+                pagePatterns 分页链接的url格式（正则表达式字符串列表），为None时使用defaultPagePatterns，见findPageLinks()
+                pageWorkers 并发抓取其他分页的线程数，默认为4
+                connectionPool ConnectionPool对象，进行http请求时使用的连接池，为None表示使用模块默认的连接池
+                asyncConnectionPool AsyncConnectionPool对象，afetch()、aarticle()使用的连接池，
+                            为None表示使用模块默认的异步连接池
+                httpCache   HttpCache对象，抓取网页时使用的http缓存，为None表示不使用缓存
+                resultCache ResultCache对象，相同的html及参数直接返回缓存的正文，为None表示不使用缓存。
+                            maxPages大于1时，其他分页的内容在抓取前未知，因此不使用此缓存
+                parser      解析html时使用的解析器，可以为lxml、html.parser、html5lib，
+                            为None表示使用可用的最快的解析器，见defaultParser()
+                engine      确定正文位置的方法，默认为lines，按行统计字数（rows、chars），依赖网页源码的换行；
+                            dom在预处理时对解析树中的区块打分，选择得分最高的区块作为正文（见scoreBlocks()），
+                            得分不大于domMinScore时没有正文，适合压缩成一行或换行很少的网页，不使用rows、chars
+                statsHook   每个处理阶段完成后调用的函数，参数为(阶段名称, 记录)，阶段及记录的说明见ArticleStats
+                traceMemory 是否使用tracemalloc统计每个阶段的内存峰值，会使处理速度变慢
+                lowMemory   低内存模式，适合批量处理大量网页：预处理完成后释放原始html，立即拆除解析树，
+                            生成正文后释放字数统计的缓存，之后只保留正文所需的body。
+                            预处理后不能再次调用preprocess()，多次调用article()时需要重新统计字数
 
             调用方式举例：
 
@@ -189,6 +1951,12 @@ class Article:
                 article.preprocess()
                 print(article.article())
 
+                例4，在asyncio中使用，网络请求不阻塞事件循环，解析及生成html在线程池中进行
+                article = Article(url = "http://www.example.com/12345.html")
+                await article.afetch()
+                await article.apreprocess()
+                print(await article.aarticle())
+
             注意，fetchPage一定要在preprocess之前，article一定要在preprocess之后。
         '''
 
@@ -196,8 +1964,13 @@ class Article:
             rows = 10
         if chars <= 0:
             chars = 60 
+        if imageWorkers <= 0:
+            imageWorkers = 8
+        if engine not in engines:
+            raise ValueError("不支持的正文提取引擎：{}".format(engine))
 
         self.__html         = html
+        self.__htmlLength   = 0     # 预处理的html的字符数，低内存模式下释放html后仍可用于统计
         self.__url          = url
         self.__rows         = rows
         self.__chars        = chars
@@ -208,112 +1981,581 @@ class Article:
         self.__withTitle    = withTitle
         self.__withSource   = withSource
         self.__prettify     = prettify
-        self.__soap         = None  # BeautifulSoup对象
+        self.__imageWorkers = imageWorkers
+        self.__hedgeDelay   = hedgeDelay
+        self.__imageCache   = imageCache
+        self.__imageProcessor = imageProcessor
+        self.__maxPages     = max(1, maxPages)
+        self.__pagePatterns = pagePatterns
+        self.__pageWorkers  = max(1, pageWorkers)
+        self.__pageLinks    = []    # 当前页面中其他分页的地址
+        self.__pages        = []    # 合并到正文中的其他分页，Article对象
+        self.__connectionPool = connectionPool if connectionPool is not None else defaultConnectionPool
+        self.__asyncConnectionPool = asyncConnectionPool if asyncConnectionPool is not None else defaultAsyncConnectionPool
+        self.__httpCache    = httpCache
+        self.__resultCache  = resultCache if self.__maxPages <= 1 else None
+        self.__htmlDigest   = None  # 输入html的sha256值，使用resultCache时在preprocess()中计算
+        self.__deferred     = False # preprocess()时命中了resultCache，推迟到需要时再进行预处理
+        self.__parser       = checkParser(parser)
+        self.__engine       = engine
+        self.__lowMemory    = lowMemory
+        self.__stats        = ArticleStats()
+        self.__statsHook    = statsHook
+        self.__traceMemory  = traceMemory
+        self.__fetchedBytes = 0     # 最近一次抓取网页时下载的字节数
         self.__base         = ""    # 保存html base字段
         self.__title        = ""    # 保存网页标题
         self.__body         = ""    # 保存网页body标签中的内容，不含body标签本身
+        self.__domBody      = ""    # engine为dom时，保存得分最高的区块的html
+        self.__bodylines    = None  # self.__body按行拆分的结果，第一次统计字数时生成
+        self.__linechars    = None  # self.__bodylines中每一行的字符个数
+        self.__linestats    = dict()    # rows -> lineStat()的结果
+
+
+    def __fetch(self, url, referer = ""):
+        ''' 抓取网页，返回解码后的html代码
+
+            参数说明：
+
+                url         要抓取的网页的url
+                referer     进行抓取时使用的referer，如果为空字符串，默认将url设置为referer
+        '''
+
+        if self.__httpCache is not None:
+            contentType, content = self.__requestCached(url, referer)
+        else:
+            _, respHeaders, content = self.__request(url, referer)
+            contentType = respHeaders.get('Content-Type', "")
+
+        return self.__decodePage(contentType, content)
+
+
+    def __decodePage(self, contentType, content):
+        ''' 根据Content-Type及网页内容检测编码，返回解码后的html '''
+
+        self.__fetchedBytes = len(content)
+        return content.decode(detectCharset(content, contentType), errors = 'replace')
+
+
+    def __encodeImage(self, imgurl, content):
+        ''' 将图片数据编码为data uri，返回("data:<mimetype>;base64,", base64编码)
+            如果设置了self.__imageProcessor，先对图片进行处理。缓存中保存原始图片，处理参数改变时不需要重新下载
+        '''
+
+        format = None
+        if self.__imageProcessor is not None:
+            content, format = self.__imageProcessor.process(content)
+        # base64编码的结果只包含ascii字符
+        import base64
+        return ("data:{};base64,".format(guessImageType(imgurl, format)), base64.b64encode(content).decode('ascii'))
+
+
+    def __requestCached(self, url, referer = ""):
+        ''' 使用self.__httpCache进行条件请求，服务器返回304时从缓存读取，返回(Content-Type, 响应内容) '''
+
+        cache = self.__httpCache
+        content = cache.lookup(url)
+        if content is not None:
+            return (cache.getMeta(url).get("contentType", ""), content)
+
+        status, respHeaders, content = self.__request(url, referer, cache.validators(url))
+        if status == 304:
+            content = cache.get(url, ignoreAge = True)
+            if content is not None:
+                return (cache.getMeta(url).get("contentType", ""), content)
+            # 缓存内容已被删除，重新下载
+            status, respHeaders, content = self.__request(url, referer)
+
+        cache.store(url, respHeaders, content)
+        return (respHeaders.get('Content-Type', ""), content)
+
+
+    def __request(self, url, referer = "", extraHeaders = None):
+        ''' 进行http请求，返回(状态码, 响应头, 响应内容)，extraHeaders为需要额外添加的请求头（字典）'''
+
+        url, headers = self.__requestHeaders(url, referer, extraHeaders)
+        # 可能会抛出ValueError、urllib.error.HTTPError、urllib.error.URLError异常
+        return self.__connectionPool.request(url, headers)
+
+
+    def __requestHeaders(self, url, referer = "", extraHeaders = None):
+        ''' 返回(转义后的url, 请求头)，参数见__request '''
+
+        # 如果url包含汉字，可以将其转义
+        safe = '''%/:=&?~#+!$,;'@()*[]'''
+        url = urllib.parse.quote(url, safe=safe)
+
+        headers = dict()
+
+        if self.__useragent != "":
+            headers['User-Agent'] = self.__useragent
+        if self.__cookie != "":
+            headers['Cookie'] = self.__cookie
+        if referer != "":
+            # 如果referer包含汉字，可以将其转义
+            headers['Referer'] = urllib.parse.quote(referer, safe=safe)
+        else:
+            headers['Referer'] = url
+
+        if extraHeaders:
+            headers.update(extraHeaders)
+
+        return (url, headers)
+
+
+    async def __arequestCached(self, url, referer = ""):
+        ''' __requestCached()的异步版本 '''
+
+        cache = self.__httpCache
+        content = cache.lookup(url)
+        if content is not None:
+            return (cache.getMeta(url).get("contentType", ""), content)
+
+        status, respHeaders, content = await self.__arequest(url, referer, cache.validators(url))
+        if status == 304:
+            content = cache.get(url, ignoreAge = True)
+            if content is not None:
+                return (cache.getMeta(url).get("contentType", ""), content)
+            # 缓存内容已被删除，重新下载
+            status, respHeaders, content = await self.__arequest(url, referer)
+
+        cache.store(url, respHeaders, content)
+        return (respHeaders.get('Content-Type', ""), content)
+
+
+    async def __arequest(self, url, referer = "", extraHeaders = None):
+        ''' __request()的异步版本，使用self.__asyncConnectionPool进行请求，
+            代理、非http地址的请求使用self.__connectionPool，与同步的版本相同
+        '''
+
+        url, headers = self.__requestHeaders(url, referer, extraHeaders)
+        return await self.__asyncConnectionPool.request(url, headers, syncPool = self.__connectionPool)
+
+
+    def __fetchImage(self, imgurl, hedgeExecutor = None):
+        ''' 抓取图片，返回data uri的前缀及base64编码：("data:<mimetype>;base64,", base64编码)，
+            如果出现异常，例如http请求错误，请求超时等，返回("", "")，出错原因记录在self.__stats.fetches中
+
+            优先从self.__imageCache读取图片，hedgeExecutor不为None时，在其中发送请求及重复请求，见hedgeDelay参数
+        '''
+
+        t = time.perf_counter()
+        content = None
+        hedged = False
+        try:
+            # 不允许的地址在读取缓存之前就拒绝，缓存目录可能与其他运行方式共用
+            self.__connectionPool.checkUrl(imgurl)
+            if self.__imageCache is not None:
+                content = self.__imageCache.get(imgurl)
+            cached = content is not None
+            if content is None:
+                if hedgeExecutor is None:
+                    _, _, content = self.__request(imgurl, imgurl)
+                else:
+                    (_, _, content), hedged = self.__hedgedRequest(imgurl, hedgeExecutor)
+                if self.__imageCache is not None:
+                    self.__imageCache.put(imgurl, content)
+            result = self.__encodeImage(imgurl, content)
+        except Exception as e:
+            self.__stats.addFetch(imgurl, "image", time.perf_counter() - t, 0, errorText(e), hedged = hedged)
+            return ("", "")
+
+        self.__stats.addFetch(imgurl, "image", time.perf_counter() - t, len(content), cached = cached, hedged = hedged)
+        return result
+
+
+    def __hedgedRequest(self, imgurl, executor):
+        ''' 在executor中请求图片，self.__hedgeDelay秒后仍未完成时再发送一个相同的请求，
+            返回(先成功的请求的结果, 是否发送了重复请求)，两个请求都失败时抛出先完成的请求的异常
+        '''
+
+        import concurrent.futures
+
+        primary = executor.submit(self.__request, imgurl, imgurl)
+        done, _ = concurrent.futures.wait([primary], timeout = self.__hedgeDelay)
+        if done:
+            return (primary.result(), False)
+
+        pending = {primary, executor.submit(self.__request, imgurl, imgurl)}
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # 另一个请求不能中断，在后台完成后被丢弃
+                    return (future.result(), True)
+                error = error or future.exception()
+        raise error
+
+
+    def __imageBase(self):
+        ''' 返回解析图片相对地址时使用的base url '''
+
+        if self.__base != "":
+            return self.__base
+        return self.__url
+
+
+    def __fetchImages(self, htm):
+        ''' 解析html中的img字段，提取出图片地址(url)并抓取图片，返回字典：url -> __fetchImage()的返回值
+
+            同一个图片地址只抓取一次，多个图片使用线程池并发抓取，并发数由self.__imageWorkers决定
+
+            参数说明：
+                htm     要处理的html代码
+        '''
+
+        imgurls = self.__imageUrls(htm)
+        if len(imgurls) == 0:
+            return dict()
+
+        # 并发抓取图片
+        import concurrent.futures
+        workers = max(1, min(self.__imageWorkers, len(imgurls)))
+        fetchImage = self.__fetchImage
+        hedgeExecutor = None
+        if self.__hedgeDelay > 0:
+            # 每个图片最多同时有两个请求
+            hedgeExecutor = concurrent.futures.ThreadPoolExecutor(max_workers = workers * 2)
+            fetchImage = functools.partial(self.__fetchImage, hedgeExecutor = hedgeExecutor)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+                images = dict(zip(imgurls, executor.map(fetchImage, imgurls)))
+        finally:
+            if hedgeExecutor is not None:
+                # 不等待被丢弃的重复请求
+                hedgeExecutor.shutdown(wait = False)
+
+        if self.__imageCache is not None:
+            self.__imageCache.flush()
+
+        return images
+
+
+    async def __afetchImages(self, htm, executor):
+        ''' __fetchImages()的异步版本，最多同时抓取self.__imageWorkers个图片，图片处理及编码在executor中进行 '''
+
+        import asyncio
+
+        imgurls = self.__imageUrls(htm)
+        if len(imgurls) == 0:
+            return dict()
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.__imageWorkers)
+
+        async def fetchImage(imgurl):
+            async with semaphore:
+                t = time.perf_counter()
+                content = None
+                hedged = False
+                try:
+                    # 与__fetchImage()相同，不允许的地址在读取缓存之前就拒绝
+                    self.__connectionPool.checkUrl(imgurl)
+                    if self.__imageCache is not None:
+                        content = self.__imageCache.get(imgurl)
+                    cached = content is not None
+                    if content is None:
+                        (_, _, content), hedged = await self.__ahedgedRequest(imgurl)
+                        if self.__imageCache is not None:
+                            self.__imageCache.put(imgurl, content)
+                    result = await loop.run_in_executor(executor, self.__encodeImage, imgurl, content)
+                except Exception as e:
+                    self.__stats.addFetch(imgurl, "image", time.perf_counter() - t, 0, errorText(e), hedged = hedged)
+                    return ("", "")
+                self.__stats.addFetch(imgurl, "image", time.perf_counter() - t, len(content),
+                    cached = cached, hedged = hedged)
+                return result
+
+        images = dict(zip(imgurls, await asyncio.gather(*map(fetchImage, imgurls))))
+
+        if self.__imageCache is not None:
+            self.__imageCache.flush()
+
+        return images
+
+
+    async def __ahedgedRequest(self, imgurl):
+        ''' __hedgedRequest()的异步版本，先成功的请求返回后取消另一个请求 '''
+
+        import asyncio
+
+        primary = asyncio.ensure_future(self.__arequest(imgurl, imgurl))
+        if self.__hedgeDelay <= 0:
+            return (await primary, False)
+        done, _ = await asyncio.wait([primary], timeout = self.__hedgeDelay)
+        if done:
+            return (primary.result(), False)
+
+        pending = {primary, asyncio.ensure_future(self.__arequest(imgurl, imgurl))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return (future.result(), True)
+                    error = error or future.exception()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+    def __imageUrls(self, htm):
+        ''' 收集htm中所有图片的完整url，去除重复的地址，并按主机轮流排列，见interleaveHosts() '''
+
+        base = self.__imageBase()
+        return interleaveHosts(dict.fromkeys(urllib.parse.urljoin(base, match.group(2))
+            for match in findImgTags(htm)))
+
+
+    def __inlineParts(self, htm, images):
+        ''' 将htm中img标签的图片地址替换为images中的data uri，分段返回替换后的html
+
+            base64编码不与html拼接，直接作为一段返回，避免复制较大的字符串
+        '''
+
+        base = self.__imageBase()
+        pos = 0
+        for match in findImgTags(htm):
+            prefix, imgb64 = images[urllib.parse.urljoin(base, match.group(2))]
+            yield htm[pos:match.start()]
+            yield '''<img{} src="{}'''.format(match.group(1), prefix)
+            yield imgb64
+            yield '''"{}>'''.format(match.group(3))
+            pos = match.end()
+        yield htm[pos:]
+
+
+    def fetchPage(self, url = ""):
+        ''' 抓取self.__url页面，如果给了url参数，则将self.__url设置为url，然后再抓取页面'''
+
+        if url != "":
+            self.__url = url
+        if self.__url == "":
+            raise ValueError("url为空")
+        t = time.perf_counter()
+        with self.__measure("fetch") as record:
+            try:
+                self.__html = self.__fetch(self.__url)
+            except Exception as e:
+                self.__stats.addFetch(self.__url, "page", time.perf_counter() - t, 0, errorText(e))
+                raise
+            record["bytes"] = self.__fetchedBytes
+        self.__stats.addFetch(self.__url, "page", time.perf_counter() - t, self.__fetchedBytes)
+
+
+    async def afetch(self, url = ""):
+        ''' fetchPage()的异步版本，使用self.__asyncConnectionPool进行请求 '''
+
+        if url != "":
+            self.__url = url
+        if self.__url == "":
+            raise ValueError("url为空")
+        t = time.perf_counter()
+        with self.__measure("fetch") as record:
+            try:
+                if self.__httpCache is not None:
+                    contentType, content = await self.__arequestCached(self.__url)
+                else:
+                    _, respHeaders, content = await self.__arequest(self.__url)
+                    contentType = respHeaders.get('Content-Type', "")
+            except Exception as e:
+                self.__stats.addFetch(self.__url, "page", time.perf_counter() - t, 0, errorText(e))
+                raise
+            self.__html = self.__decodePage(contentType, content)
+            record["bytes"] = self.__fetchedBytes
+        self.__stats.addFetch(self.__url, "page", time.perf_counter() - t, self.__fetchedBytes)
+
+
+    async def apreprocess(self, executor = None):
+        ''' 在executor（concurrent.futures.Executor对象，为None表示事件循环默认的线程池）中执行preprocess()，
+            解析html时不阻塞事件循环。maxPages大于1时，其他分页也在executor中使用同步的方式抓取
+        '''
 
+        import asyncio
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, self.preprocess)
 
-    def __fetch(self, url, image = False, referer = ""):
-        ''' 抓取网页的html代码或图片的base64编码
 
-            参数说明：
+    @contextlib.contextmanager
+    def __measure(self, name):
+        ''' 统计一个处理阶段的耗时及内存峰值，数据量由调用方写入record["bytes"] '''
 
-                url         要抓取的网页或图片的url
-                image       False表示抓取网页，True表示抓取是图片。抓取图片时，将图片编码为base64字符串返回。
-                referer     进行抓取时使用的referer，如果为空字符串，默认将url设置为referer
-        '''
+        record = {"bytes": 0}
+        started = False
+        if self.__traceMemory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started = True
+            tracemalloc.reset_peak()
 
-        # 如果url包含汉字，可以将其转义
-        safe = '''%/:=&?~#+!$,;'@()*[]'''
-        url = urllib.parse.quote(url, safe=safe)
+        t = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - t
+            record["peak"] = None
+            if self.__traceMemory:
+                record["peak"] = tracemalloc.get_traced_memory()[1]
+                if started:
+                    tracemalloc.stop()
 
-        headers = dict()
+            self.__stats.add(name, record["seconds"], record["bytes"], record["peak"])
+            if self.__statsHook is not None:
+                self.__statsHook(name, record)
 
-        if self.__useragent != "":
-            headers['User-Agent'] = self.__useragent
-        if self.__cookie != "":
-            headers['Cookie'] = self.__cookie
-        if referer != "":
-            # 如果referer包含汉字，可以将其转义
-            headers['Referer'] = urllib.parse.quote(referer, safe=safe)
-        else:
-            headers['Referer'] = url
 
-        # 可能会抛出ValueError异常：unknown url type
-        req = urllib.request.Request(url, headers = headers)
+    def stats(self):
+        ''' 返回ArticleStats对象，记录了fetchPage、preprocess、article各阶段的耗时等数据 '''
+        return self.__stats
 
-        # 可能会抛出urllib.error.HTTPError异常
-        content = urllib.request.urlopen(req).readall()
 
-        if image: 
-            content = base64.b64encode(content)
+    def preprocess(self):
+        ''' 对self.__html进行预处理，生成self.__title，self.__base，self.__body
+            在调用此方法前，需要确保self.__html不为空，如果self.__html为空，可以使用fetchPage抓取网页
 
-        try:
-            content = content.decode('utf-8')
-        except UnicodeDecodeError:
-            content = content.decode('gbk')
+            如果maxPages大于1，查找并抓取其他分页，对每一页分别进行预处理，生成正文时按顺序合并
 
-        return content
+            如果设置了resultCache并且缓存中有使用默认参数提取的正文，不进行预处理，
+            只从缓存中读取标题，使用其他参数生成正文、sweep()等需要预处理结果时再进行预处理
+        '''
 
+        if self.__html == "" and self.__body != "" and self.__lowMemory:
+            raise ValueError("低内存模式下原始html已释放，不能再次进行预处理")
 
-    def __image2inline(self, htm):
-        ''' 解析html中的img字段，提取出图片地址(url)，替换为base64编码
+        self.__deferred = False
+        if self.__resultCache is not None:
+            import hashlib
+            self.__htmlDigest = hashlib.sha256(self.__html.encode('utf-8', 'surrogatepass')).hexdigest()
+            cached = self.__resultCache.lookup(self.__resultKey(self.__resolveOptions()))
+            if cached is not None:
+                self.__title = cached[0]
+                self.__deferred = True
+                return
 
-            参数说明：
-                htm     要处理的html代码
-        '''
+        self.__preprocess()
 
-        def repl(match):
-            base = self.__url
-            if self.__base != "":
-                base = self.__base
-                
-            imgurl = urllib.parse.urljoin(base, match.group(2))
-            mime = guessImageType(imgurl)
+        self.__pages = []
+        if self.__maxPages > 1:
+            with self.__measure("pages") as record:
+                self.__fetchPages()
+                record["bytes"] = sum(page.__htmlLength for page in self.__pages)
 
-            try:
-                imgb64 = self.__fetch(imgurl, image = True, referer = imgurl)
 
-                b64 = "data:{};base64,{}".format(mime, imgb64)
-            # 如果出现异常，例如http请求错误，请求超时等，返回空字符串
-            except:
-                b64 = ""
+    def __ensurePreprocessed(self):
+        ''' preprocess()时命中了resultCache而没有进行预处理，现在进行预处理 '''
 
-            return '''<img{} src="{}"{}>'''.format(match.group(1), b64, match.group(3))
+        if self.__deferred:
+            self.__deferred = False
+            self.__preprocess()
 
-        return re.sub(r"""<img([^>]*?) src=['"]([^>'"]+)['"]([^>]*)>""", repl, htm, flags = re.IGNORECASE | re.DOTALL)
 
+    def pageUrls(self):
+        ''' 返回合并到正文中的所有页面的url，第一项为当前页面 '''
+        return [self.__url] + [page.__url for page in self.__pages]
 
-    def fetchPage(self, url = ""):
-        ''' 抓取self.__url页面，如果给了url参数，则将self.__url设置为url，然后再抓取页面'''
 
-        if url != "":
-            self.__url = url
-        if self.__url == "":
-            raise ValueError("url为空")
-        self.__html = self.__fetch(self.__url)
+    def __fetchPages(self):
+        ''' 从当前页面开始查找其他分页，每一轮并发抓取所有已知的分页，再从抓取到的分页中查找新的分页，
+            直到没有新的分页或者达到self.__maxPages页。已抓取过的url及内容与已有页面相同的分页会被跳过，避免循环。
+            抓取或处理失败的分页被忽略。
+        '''
 
-    
-    def preprocess(self):
-        ''' 对self.__html进行预处理，生成self.__soap，self.__title，self.__body
-            在调用此方法前，需要确保self.__html不为空，如果self.__html为空，可以使用fetchPage抓取网页
+        import concurrent.futures
+
+        seen = {urllib.parse.urldefrag(self.__url)[0]}
+        bodies = {hash(self.__body)}
+        links = self.__pageLinks
+
+        while len(self.__pages) + 1 < self.__maxPages:
+            urls = []
+            for link in links:
+                if link not in seen and len(self.__pages) + len(urls) + 1 < self.__maxPages:
+                    seen.add(link)
+                    urls.append(link)
+            if len(urls) == 0:
+                break
+
+            workers = min(self.__pageWorkers, len(urls))
+            with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+                pages = list(executor.map(self.__fetchNextPage, urls))
+
+            links = []
+            for page in pages:
+                # 第一页的body中是相对地址，需要在转换地址之前比较内容
+                if page is None or hash(page.__body) in bodies:
+                    continue
+                bodies.add(hash(page.__body))
+                # 合并后使用第一页的base，因此将分页中的相对地址转换为完整地址
+                page.__body = absoluteLinks(page.__body, page.__imageBase())
+                if page.__domBody != "":
+                    page.__domBody = absoluteLinks(page.__domBody, page.__imageBase())
+                self.__pages.append(page)
+                links.extend(page.__pageLinks)
+
+
+    def __fetchNextPage(self, url):
+        ''' 抓取并预处理一个分页，返回Article对象，出错时返回None，抓取结果记录在self.__stats.fetches中 '''
+
+        page = Article(url = url, useragent = self.__useragent, cookie = self.__cookie,
+            imageCache = self.__imageCache, connectionPool = self.__connectionPool, httpCache = self.__httpCache,
+            parser = self.__parser, imageProcessor = self.__imageProcessor, maxPages = self.__maxPages,
+            pagePatterns = self.__pagePatterns, lowMemory = self.__lowMemory, engine = self.__engine)
+        try:
+            page.fetchPage()
+            page.__preprocess()
+        except Exception as e:
+            if len(page.__stats.failedFetches()) == 0:
+                page.__stats.addFetch(url, "page", 0, 0, errorText(e))
+            return None
+        finally:
+            self.__stats.fetches.extend(page.__stats.fetches)
+        return page
+
+
+    def __preprocess(self):
+        ''' 解析self.__html，生成self.__title、self.__base、self.__body，不抓取其他分页
+            解析树只在这个方法中使用，返回后即被释放
         '''
+
         if self.__html == "":
             raise ValueError("网页内容为空")
 
-        # 生成 self.__soap (BeautifulSoup对象)
-        self.__soap = BeautifulSoup(self.__html, "html.parser")
+        # 生成 soap (BeautifulSoup对象)
+        from bs4 import BeautifulSoup
+        with self.__measure("parse") as record:
+            soap = BeautifulSoup(self.__html, self.__parser)
+            self.__htmlLength = len(self.__html)
+            record["bytes"] = self.__htmlLength
+
+        with self.__measure("clean") as record:
+            self.__clean(soap)
+            record["bytes"] = len(self.__body)
+
+        if self.__lowMemory:
+            # 解析树中的节点互相引用，需要等待垃圾回收才能释放，decompose()拆除引用后可以立即释放
+            soap.decompose()
+            self.__html = ""
+
+
+    def __clean(self, soap):
+        ''' 从soap中提取标题、base，清理body，生成self.__title、self.__base、self.__body
+            engine为dom时对清理后的body中的区块打分，生成self.__domBody
+        '''
 
-        # 生成 self.__title
+        # 生成 self.__title，转换为str，NavigableString会引用整个解析树
         try:
-            self.__title = self.__soap.title.string
+            title = soap.title.string
+            self.__title = str(title) if title is not None else None
         except AttributeError:
             self.__title = ""
 
         # 生成 self.__base
         try:
-            for item in self.__soap.head.find_all("base"):
+            for item in soap.head.find_all("base"):
                 href = item.get('href')
                 if href is not None:
                     self.__base = href
@@ -324,16 +2566,21 @@ class Article:
         if self.__base == "" and self.__url != "":
             self.__base = self.__url
 
-        # 生成 self.__body
+        # 在清理body之前查找其他分页的地址，分页链接可能位于被删除的nav、footer等标签中
+        self.__pageLinks = []
+        if self.__maxPages > 1:
+            self.__pageLinks = findPageLinks(soap, self.__url, self.__pagePatterns,
+                urllib.parse.urljoin(self.__url, self.__base))
 
-        # 从html中提取body标签中的所有内容（不含body标签本身），如果没有获取到，将其设置为self.__html的内容
-        match = re.search("<body[^>]*>(.*)</body>", self.__html, flags = re.IGNORECASE | re.DOTALL)
-        if match is not None:
-            body = match.group(1)
-        else:
-            body = self.__html
+        # 生成 self.__body
 
-        body = BeautifulSoup(body, "html.parser")
+        # 直接在soap上处理body标签中的所有内容（不含body标签本身），如果html中没有完整的body标签，处理整个网页
+        # lxml、html5lib总会补全body标签，因此只要存在body节点就处理body节点
+        # 以下各步骤均在同一个DOM树上进行，最后只转换一次字符串
+        body = soap
+        if soap.body is not None and (self.__parser != "html.parser" or
+                hasBodyTag(self.__html)):
+            body = soap.body
 
         # 删除body中位于最外层的标签及标签中的内容
         for i in body.find_all(['nav', 'footer', 'header'], recursive = False):
@@ -354,32 +2601,154 @@ class Article:
         body = removeHtmlAttributes(body, ["style", "class", "id", "target"])
 
         # 去除html注释
-        body = removeHtmlComments(str(body))
+        body = removeCommentNodes(body)
 
         # pre标签转换为p标签
-        body = pre2p(body)
+        body = pre2pNodes(body)
+
+        self.__domBody = ""
+        if self.__engine == "dom":
+            self.__decodeBlock(body)
+        else:
+            self.__body = body.decode_contents()
+
+        # body已改变，丢弃之前的字数统计
+        self.__resetLineCaches()
 
-        self.__body = body
+
+    def __decodeBlock(self, body):
+        ''' 对body中的区块打分，生成self.__body及得分最高的区块的html self.__domBody，
+            得分不大于domMinScore时self.__domBody为空字符串
+
+            在区块前后插入标记后只转换一次字符串，再按标记拆分，避免将区块再转换一次。
+            原始html中含有标记时（标记无法与网页内容区分）单独转换区块。
+        '''
+
+        best, score = scoreBlocks(body)
+        if score <= domMinScore:
+            self.__body = body.decode_contents()
+            self.__domBody = ""
+            return
+        if best is body:
+            self.__body = body.decode_contents()
+            self.__domBody = self.__body
+            return
+        if _blockMarker in self.__html:
+            self.__body = body.decode_contents()
+            self.__domBody = best.decode()
+            return
+
+        from bs4.element import NavigableString
+        start = NavigableString(_blockMarker)
+        end = NavigableString(_blockMarker)
+        best.insert_before(start)
+        best.insert_after(end)
+        before, block, after = body.decode_contents().split(_blockMarker)
+        start.extract()
+        end.extract()
+        self.__body = before + block + after
+        self.__domBody = block
+
+
+    def __resetLineCaches(self):
+        ''' 丢弃按行拆分的body及字数统计的缓存 '''
+
+        self.__bodylines = None
+        self.__linechars = None
+        self.__linestats = dict()
 
 
     def getTitle(self):
         return self.__title
 
 
-    def article(self, *, iimage = None, noCharsStat = None, withTitle = None, withSource = None, prettify = None):
+    def article(self, *, iimage = None, noCharsStat = None, withTitle = None, withSource = None, prettify = None,
+            rows = None, chars = None):
         ''' 生成正文内容，返回html代码
-            
-            参数说明（所有参数均为keyword argument）：
+
+            参数说明（所有参数均为keyword argument，为None时使用创建Article实例时的设置）：
 
                 iimage          是否将图片转换为inline image
                 noCharsStat     如果为True表示不使用字符数统计方式确定正文
                 withTitle       输出中插入文章标题
                 withSource      输出中插入文章url
+                prettify        是否将输出的html代码进行格式化
+                rows、chars     统计字数时使用的rows、chars
+
+            多次调用时，每一行的字符个数及每个rows对应的统计结果只计算一次
         '''
 
-        body = self.__body
-        if body == "":
-            raise ValueError("网页body部分为空")
+        return "".join(self.articleParts(iimage = iimage, noCharsStat = noCharsStat, withTitle = withTitle,
+            withSource = withSource, prettify = prettify, rows = rows, chars = chars))
+
+
+    def articleParts(self, *, iimage = None, noCharsStat = None, withTitle = None, withSource = None, prettify = None,
+            rows = None, chars = None):
+        ''' 生成正文内容，返回分段的html代码（迭代器），参数与article()相同
+
+            图片的base64编码作为单独的分段返回，不生成完整的html字符串，适合直接写入文件：
+
+                with open("out.html", mode = 'wt') as f:
+                    f.writelines(article.articleParts(iimage = True))
+
+            返回之前已经完成字数统计、html处理及图片抓取，出错时抛出异常，不会返回部分结果。
+            设置了resultCache时，正文需要保存到缓存中，因此生成完整的html字符串后再返回。
+        '''
+
+        options = self.__resolveOptions(iimage = iimage, noCharsStat = noCharsStat, withTitle = withTitle,
+            withSource = withSource, prettify = prettify, rows = rows, chars = chars)
+        key = self.__resultKey(options)
+        cached = self.__cachedResult(key)
+        if cached is not None:
+            return iter([cached])
+
+        head, htmlstring, tail = self.__render(**options)
+
+        # html已经生成，最后将img处理为inline模式，图片的base64编码不再经过html解析器
+        images = dict()
+        if options["iimage"]:
+            with self.__measure("inline") as record:
+                images = self.__fetchImages(htmlstring)
+                record["bytes"] = sum(len(prefix) + len(imgb64) for prefix, imgb64 in images.values())
+
+        parts = self.__joinParts(head, htmlstring, tail, images)
+        if key is None:
+            return parts
+        return iter([self.__storeResult(key, parts, images)])
+
+
+    async def aarticle(self, *, executor = None, iimage = None, noCharsStat = None, withTitle = None,
+            withSource = None, prettify = None, rows = None, chars = None):
+        ''' article()的异步版本，字数统计及生成html在executor中进行（见apreprocess()），
+            图片使用self.__asyncConnectionPool并发抓取，其他参数与article()相同
+        '''
+
+        import asyncio
+        loop = asyncio.get_running_loop()
+        options = self.__resolveOptions(iimage = iimage, noCharsStat = noCharsStat, withTitle = withTitle,
+            withSource = withSource, prettify = prettify, rows = rows, chars = chars)
+        key = self.__resultKey(options)
+        cached = self.__cachedResult(key)
+        if cached is not None:
+            return cached
+
+        head, htmlstring, tail = await loop.run_in_executor(executor, functools.partial(self.__render, **options))
+
+        images = dict()
+        if options["iimage"]:
+            with self.__measure("inline") as record:
+                images = await self.__afetchImages(htmlstring, executor)
+                record["bytes"] = sum(len(prefix) + len(imgb64) for prefix, imgb64 in images.values())
+
+        parts = self.__joinParts(head, htmlstring, tail, images)
+        if key is None:
+            return "".join(parts)
+        return self.__storeResult(key, parts, images)
+
+
+    def __resolveOptions(self, *, iimage = None, noCharsStat = None, withTitle = None, withSource = None,
+            prettify = None, rows = None, chars = None):
+        ''' 返回生成正文时使用的参数（字典），参数为None时使用创建Article实例时的设置 '''
 
         if iimage is None:
             iimage = self.__iimage
@@ -391,48 +2760,217 @@ class Article:
             withSource = self.__withSource
         if prettify is None:
             prettify = self.__prettify
+        if rows is None or rows <= 0:
+            rows = self.__rows
+        if chars is None or chars <= 0:
+            chars = self.__chars
 
-        # 进行字数统计
-        if noCharsStat is False:
-            bodylines = body.splitlines()
-
-            # 遍历body中的每一行，去掉html，去掉前后的空格，计算每一行中的字符个数，保存到linechars
-            linechars = []
-            for line in bodylines:
-                linechars.append(len(BeautifulSoup(line, "html.parser").get_text().strip()))
-
-            # 遍历每一行，统计当前行+上rows行+下rows行中，所有的字符个数，保存到linestat
-            # linestat中大于chars的单元的序号，就是属于正文的内容对应在bodylines的序号
-            linestat = []
-            htmlstring = [] # 保存属于正文部分的html
-            n = 0 # 当前所在行数
-            for line in linechars:
-                r1 = n - self.__rows - 1 # list开始位置
-                r2 = n + self.__rows     # list结束位置
-                if r1 < 0 :
-                    r1 = 0
-                    r2 = 1 + 2 * self.__rows
-                linestat.append(sum(linechars[r1:r2]))
-
-                if sum(linechars[r1:r2]) >= self.__chars:
-                    htmlstring.append(bodylines[n])
-
-                n = n + 1
-            htmlstring = ''.join(htmlstring)
-        # 不进行字数统计
+        return dict(iimage = iimage, noCharsStat = noCharsStat, withTitle = withTitle, withSource = withSource,
+            prettify = prettify, rows = rows, chars = chars)
+
+
+    def __resultKey(self, options):
+        ''' 返回options（__resolveOptions()的返回值）对应的resultCache的键，不使用resultCache时返回None '''
+
+        if self.__resultCache is None or self.__htmlDigest is None:
+            return None
+
+        options = dict(options, parser = self.__parser, engine = self.__engine, imageProcessor = None)
+        processor = self.__imageProcessor
+        if options["iimage"] and processor is not None:
+            options["imageProcessor"] = [processor.maxWidth, processor.maxHeight, processor.quality, processor.format]
+        return ResultCache.makeKey(self.__htmlDigest, self.__url, options)
+
+
+    def __cachedResult(self, key):
+        ''' 从resultCache读取key对应的正文，没有缓存时返回None '''
+
+        if key is None:
+            return None
+        with self.__measure("cache") as record:
+            cached = self.__resultCache.lookup(key)
+            if cached is None:
+                return None
+            record["bytes"] = len(cached[1])
+        return cached[1]
+
+
+    def __storeResult(self, key, parts, images):
+        ''' 生成完整的正文并保存到resultCache，返回正文。有图片抓取失败时不保存，以便下次重新抓取 '''
+
+        html = "".join(parts)
+        if all(prefix != "" for prefix, _ in images.values()):
+            self.__resultCache.store(key, self.getTitle() or "", html)
+        return html
+
+
+    def __render(self, *, iimage, noCharsStat, withTitle, withSource, prettify, rows, chars):
+        ''' 统计字数并生成不含图片data uri的html，参数为__resolveOptions()的返回值
+            返回(正文之前的部分, 正文, 正文之后的部分)
+        '''
+
+        self.__ensurePreprocessed()
+        body = self.__body
+        if body == "":
+            raise ValueError("网页body部分为空")
+
+        with self.__measure("density") as record:
+            htmlstring = self.__density(body, noCharsStat, rows, chars)
+            # 其他分页分别统计字数，结果按顺序合并
+            for page in self.__pages:
+                htmlstring += page.__density(page.__body, noCharsStat, rows, chars)
+            record["bytes"] = len(htmlstring)
+
+        with self.__measure("serialize") as record:
+            htmlstring = self.__serialize(htmlstring, prettify)
+            head, tail = self.__document(withTitle, withSource)
+            record["bytes"] = len(head) + len(htmlstring) + len(tail)
+
+        if self.__lowMemory:
+            for article in [self] + self.__pages:
+                article.__resetLineCaches()
+
+        return (head, htmlstring, tail)
+
+
+    def __joinParts(self, head, htmlstring, tail, images):
+        ''' 返回分段的html代码（迭代器），images为__fetchImages()的返回值 '''
+
+        yield head
+        if images:
+            yield from self.__inlineParts(htmlstring, images)
         else:
-            htmlstring = body
+            yield htmlstring
+        yield tail
+
+
+    def __lineChars(self):
+        ''' 返回(bodylines, linechars)，bodylines为self.__body中的每一行，linechars为每一行的字符个数
+            结果在preprocess之后只计算一次
+        '''
+
+        if self.__linechars is None:
+            self.__bodylines = self.__body.splitlines()
+            # 遍历body中的每一行，去掉html，去掉前后的空格，计算每一行中的字符个数
+            self.__linechars = [textLength(line) for line in self.__bodylines]
+        return (self.__bodylines, self.__linechars)
+
+
+    def __lineStat(self, rows):
+        ''' 返回当前行+上rows行+下rows行中所有的字符个数，每个rows只计算一次 '''
+
+        linestat = self.__linestats.get(rows)
+        if linestat is None:
+            _, linechars = self.__lineChars()
+            if len(linechars) > numpyLineThreshold:
+                try:
+                    linestat = lineStatNumpy(linechars, rows)
+                except ImportError:
+                    pass
+            if linestat is None:
+                linestat = lineStat(linechars, rows)
+            self.__linestats[rows] = linestat
+        return linestat
+
+
+    def __density(self, body, noCharsStat, rows, chars):
+        ''' 通过统计字数确定正文位置，返回属于正文部分的html，noCharsStat为True时直接返回body
+            engine为dom时返回预处理时选出的区块，不使用rows、chars
+        '''
+
+        # 不进行字数统计
+        if noCharsStat is not False:
+            return body
+
+        if self.__engine == "dom":
+            return self.__domBody
+
+        # linestat中大于等于chars的单元的序号，就是属于正文的内容对应在bodylines的序号
+        bodylines, _ = self.__lineChars()
+        linestat = self.__lineStat(rows)
+
+        htmlstring = [] # 保存属于正文部分的html
+        for n, stat in enumerate(linestat):
+            if stat >= chars:
+                htmlstring.append(bodylines[n])
+        return ''.join(htmlstring)
+
+
+    def sweep(self, rowsList = None, charsList = None):
+        ''' 对rowsList、charsList中的每一组(rows, chars)统计会被选为正文的行，不生成html
+
+            每一行的字符个数只计算一次，每个rows的统计结果只计算一次，适合比较多组参数的效果。
+            rowsList、charsList为None时使用模块变量sweepRows、sweepChars。
+
+            返回值：列表，每一项为scoreLines()返回的字典，另外包含rows、chars两项
+        '''
+
+        self.__ensurePreprocessed()
+        if self.__body == "":
+            raise ValueError("网页body部分为空")
+        if rowsList is None:
+            rowsList = sweepRows
+        if charsList is None:
+            charsList = sweepChars
+
+        with self.__measure("sweep") as record:
+            _, linechars = self.__lineChars()
+            result = []
+            for rows in rowsList:
+                linestat = self.__lineStat(rows)
+                for chars in charsList:
+                    score = scoreLines(linechars, linestat, chars)
+                    score["rows"] = rows
+                    score["chars"] = chars
+                    result.append(score)
+            record["bytes"] = len(self.__body)
+        return result
+
+
+    def autoTune(self, rowsList = None, charsList = None, apply = False):
+        ''' 从sweep()的结果中自动选择一组(rows, chars)，返回这一组的统计结果（字典），没有可选的结果时返回None
+
+            选择方法：正文区块中每一行的字符个数通常高于全文的平均值，导航、链接列表等区块则低于平均值。
+            对每组参数选出的字符个数最多的区块（largestBlock），计算区块中每一行超出平均值的字符个数之和，
+            减去区块之外被选中的字符个数，选择结果最大的一组，相同时选择排在前面的一组。
+
+            apply为True时，将选择的rows、chars设置为之后调用article()时的默认值。
+        '''
+
+        scores = [i for i in self.sweep(rowsList, charsList) if i["largestBlock"] is not None]
+        if len(scores) == 0:
+            return None
+
+        _, linechars = self.__lineChars()
+        mean = sum(linechars) / len(linechars)
+
+        def excess(score):
+            start, end = score["largestBlock"]
+            return (score["largestChars"] - mean * (end - start)) - (score["selectedChars"] - score["largestChars"])
+
+        best = max(scores, key = excess)
+
+        if apply:
+            self.__rows = best["rows"]
+            self.__chars = best["chars"]
+        return best
 
-        # 完成body部分html代码的获取，下面开始将img处理为inline模式
-        if iimage:
-            htmlstring = self.__image2inline(htmlstring)
 
-        soap = removeEmptyHtmlTags(BeautifulSoup(htmlstring, "html.parser"))
+    def __serialize(self, htmlstring, prettify):
+        ''' 去除正文中的空标签，生成正文部分的html代码 '''
 
-        if prettify:
-            htmlstring = soap.prettify()
+        soap = removeEmptyHtmlTags(parseFragment(htmlstring, self.__parser))
+
+        if soap.name == "body":
+            return soap.decode_contents(indent_level = 0 if prettify else None)
+        elif prettify:
+            return soap.prettify()
         else:
-            htmlstring = str(soap)
+            return str(soap)
+
+
+    def __document(self, withTitle, withSource):
+        ''' 返回包裹正文的html代码：(正文之前的部分, 正文之后的部分)，包括标题、原文地址等内容 '''
 
         title = self.__title
         if title == "":
@@ -451,10 +2989,337 @@ class Article:
         if self.__base != "":            
             base = r"""<base href="{}"/>""".format(self.__base)
 
-        htmlstring = (r"""<!DOCTYPE html><html><head>{}<meta charset="utf-8" />"""
-            r"""<title>{}</title></head><body>{}{}</body></html>""").format(base, title, head, htmlstring)
+        return ((r"""<!DOCTYPE html><html><head>{}<meta charset="utf-8" />"""
+            r"""<title>{}</title></head><body>{}""").format(base, title, head), "</body></html>")
+
+
+# 工作进程中使用的缓存对象，每个工作进程只创建一次
+_workerCaches = dict()
+
+
+def _workerCache(cls, *args, **kwargs):
+    key = (cls.__name__, args, tuple(sorted(kwargs.items())))
+    if key not in _workerCaches:
+        _workerCaches[key] = cls(*args, **kwargs)
+    return _workerCaches[key]
+
+
+def readSources(f):
+    ''' 从文件对象f中读取批量处理的url或本地文件列表，每行一个，忽略空行和#开头的行 '''
+    sources = []
+    for line in f:
+        line = line.strip()
+        if line != "" and not line.startswith("#"):
+            sources.append(line)
+    return sources
+
+
+def batchExtract(source, options):
+    ''' 批量处理时在工作进程中提取一个url或本地文件的正文
+
+        参数说明：
+            source      url（http://或https://开头）或本地html文件路径
+            options     Article的参数（字典），其中imageCache为图片缓存目录，
+                        httpCache为(网页缓存目录, 最大字节数, refresh)，可以为None，
+                        hostScheduler为HostScheduler的(maxPerHost, rate)，可以为None，
+                        connectionPool为ConnectionPool的其他参数（字典），可以为None，
+                        resultCache为(正文缓存目录, 最大字节数)，可以为None
+
+        返回值：字典，包含source、title、html、error、seconds、dropped，出错时error为错误信息，html为None，
+                dropped为抓取失败的图片及原因的列表
+    '''
+    import urllib.error
+    start = time.time()
+    result = {"source": source, "title": "", "html": None, "error": None, "dropped": []}
+
+    options = dict(options)
+    if options.get("imageCache") is not None:
+        options["imageCache"] = _workerCache(ImageCache, options["imageCache"])
+    if options.get("httpCache") is not None:
+        path, maxSize, refresh = options["httpCache"]
+        options["httpCache"] = _workerCache(HttpCache, path, maxSize = maxSize, refresh = refresh)
+    if options.get("resultCache") is not None:
+        path, maxSize = options["resultCache"]
+        options["resultCache"] = _workerCache(ResultCache, path, maxSize = maxSize)
+    hostScheduler = options.pop("hostScheduler", None)
+    poolOptions = options.pop("connectionPool", None) or dict()
+    if hostScheduler is not None or poolOptions:
+        scheduler = _workerCache(HostScheduler, *hostScheduler) if hostScheduler is not None else None
+        options["connectionPool"] = _workerCache(ConnectionPool, scheduler = scheduler, **poolOptions)
+
+    # 每个Article只生成一次正文，使用低内存模式
+    options.setdefault("lowMemory", True)
+
+    try:
+        if re.match(r"https?://", source, flags = re.IGNORECASE):
+            article = Article(url = source, **options)
+            article.fetchPage()
+        else:
+            with open(source, mode = 'rb') as f:
+                content = f.read()
+            article = Article(html = content.decode(detectCharset(content), errors = 'replace'), **options)
+        article.preprocess()
+        result["html"] = article.article()
+        # getTitle()返回的可能是BeautifulSoup的字符串对象，需要转换为str才能传回主进程
+        title = article.getTitle()
+        result["title"] = str(title) if title is not None else ""
+        result["dropped"] = [{"url": record["url"], "error": record["error"]}
+            for record in article.stats().failedFetches() if record["type"] == "image"]
+    except urllib.error.URLError as e:
+        result["error"] = "抓取网页时出错：{}".format(e.reason)
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+
+    # 每个项目处理完后写入一次索引文件，保存网页、正文时不重写整个索引
+    for key in ["httpCache", "resultCache"]:
+        if options.get(key) is not None:
+            options[key].flush()
+
+    result["seconds"] = round(time.time() - start, 3)
+    return result
+
+
+def runBatch(sources, outdir, options, workers = 0, maxTasks = 50):
+    ''' 使用进程池批量提取正文，每个结果写入outdir中的一个文件，文件名由createFilename生成，
+        并在outdir中生成manifest.json，记录每个url或文件的处理结果
+
+        参数说明：
+            sources     url或本地文件路径列表
+            outdir      输出目录，不存在时自动创建
+            options     Article的参数，见batchExtract
+            workers     工作进程数，0表示使用cpu个数。options中的hostScheduler限制了每个主机的并发数时，
+                        工作进程数不超过该并发数
+            maxTasks    每个工作进程处理maxTasks个项目后重新创建，以免内存持续增长
+
+        返回值：处理失败的项目个数
+    '''
+    import multiprocessing
+    os.makedirs(outdir, exist_ok = True)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    processes = min(workers, max(1, len(sources)))
+
+    # 每个工作进程有自己的HostScheduler，由各进程平分每个主机的并发数及请求速率。
+    # 每个进程对同一主机至少可以进行1个请求，因此进程数不能超过每个主机的并发数
+    if options.get("hostScheduler") is not None:
+        maxPerHost, rate = options["hostScheduler"]
+        if maxPerHost > 0:
+            processes = min(processes, maxPerHost)
+            maxPerHost = maxPerHost // processes
+        options = dict(options, hostScheduler = (maxPerHost, rate / processes))
+
+    manifest = []
+    failed = 0
+    with multiprocessing.Pool(processes = processes, maxtasksperchild = maxTasks) as pool:
+        # 文件名在主进程中按顺序生成，以免多个进程生成相同的文件名
+        for result in pool.imap(functools.partial(batchExtract, options = options), sources):
+            html = result.pop("html")
+            result["output"] = None
+            if html is None:
+                failed += 1
+                print("失败：{} {}".format(result["source"], result["error"]), file = sys.stderr)
+            else:
+                result["output"] = createFilename(result["title"], outdir)
+                with open(os.path.join(outdir, result["output"]), mode = 'wt') as f:
+                    f.write(html)
+                print("生成文件：{}".format(os.path.join(outdir, result["output"])))
+            manifest.append(result)
+
+    with open(os.path.join(outdir, "manifest.json"), mode = 'wt', encoding = 'utf-8') as f:
+        json.dump(manifest, f, ensure_ascii = False, indent = 1)
+
+    return failed
+
+
+def _defineServer():
+    ''' 定义ExtractHandler、ExtractServer，http.server模块只在启动服务时导入 '''
+
+    global ExtractHandler, ExtractServer
+
+    if "ExtractServer" in globals():
+        return
+
+    import http.server
+    import concurrent.futures
+    import urllib.error
+
+    class ExtractHandler(http.server.BaseHTTPRequestHandler):
+        ''' 正文提取服务的请求处理
+
+            GET /?url=<url>         抓取url并提取正文，返回html
+            POST /                  请求内容为json，包含url或html字段，返回json：{"title": 标题, "html": 正文}
+
+            两种请求均可以设置以下参数覆盖服务启动时的参数：
+            rows、chars、iimage、noCharsStat、withTitle、withSource、prettify、maxPages、engine
+            maxPages不能超过服务启动时的设置。url只能为http、https地址。
+        '''
+
+        protocol_version = "HTTP/1.1"
+
+        # 连接空闲（包括keep-alive连接等待下一个请求）超过此秒数时关闭连接，避免空闲连接一直占用处理线程
+        timeout = 5
+
+        # 可以在请求中设置的参数及其类型
+        overridable = {"rows": int, "chars": int, "iimage": bool, "noCharsStat": bool,
+            "withTitle": bool, "withSource": bool, "prettify": bool, "maxPages": int, "engine": str}
+
+
+        def __reply(self, status, content, contentType):
+            body = content.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', "{}; charset=utf-8".format(contentType))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+
+        def __replyError(self, status, message):
+            self.__reply(status, json.dumps({"error": message}, ensure_ascii = False), "application/json")
+
+
+        def __extract(self, url, html, params):
+            ''' 提取正文，返回(标题, 正文)，出错时发送错误响应并返回None '''
+
+            options = dict(self.server.options)
+            try:
+                for key, value in params.items():
+                    if key not in self.overridable:
+                        continue
+                    if self.overridable[key] is bool and isinstance(value, str):
+                        value = value.lower() in ["1", "true", "yes"]
+                    options[key] = self.overridable[key](value)
+            except (TypeError, ValueError) as e:
+                self.__replyError(400, "参数错误：{}".format(e))
+                return None
+            # 每个请求最多抓取的分页数不能超过服务启动时的设置
+            limit = self.server.options.get("maxPages", 1)
+            options["maxPages"] = min(options.get("maxPages", limit), limit)
+
+            if url != "" and urllib.parse.urlsplit(url).scheme.lower() not in ["http", "https"]:
+                self.__replyError(400, "url只能为http、https地址")
+                return None
+
+            try:
+                article = Article(html = html, url = url, **options)
+                if html == "":
+                    article.fetchPage()
+                article.preprocess()
+                content = article.article()
+            except urllib.error.URLError as e:
+                self.__replyError(502, "抓取网页时出错：{}".format(e.reason))
+                return None
+            except ValueError as e:
+                self.__replyError(400, str(e))
+                return None
+            except Exception as e:
+                self.__replyError(500, "{}: {}".format(type(e).__name__, e))
+                return None
+            finally:
+                # 每个请求处理完后写入一次索引文件
+                for key in ["httpCache", "resultCache"]:
+                    if options.get(key) is not None:
+                        options[key].flush()
+
+            title = article.getTitle()
+            return (str(title) if title is not None else "", content)
+
+
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            params = {k: v[0] for k, v in query.items()}
+            if params.get("url", "") == "":
+                self.__replyError(400, "缺少url参数")
+                return
+            result = self.__extract(params["url"], "", params)
+            if result is not None:
+                self.__reply(200, result[1], "text/html")
+
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                params = json.loads(self.rfile.read(length).decode('utf-8'))
+                if not isinstance(params, dict):
+                    raise ValueError("请求内容必须为json对象")
+            except ValueError as e:
+                self.__replyError(400, "请求内容错误：{}".format(e))
+                return
+
+            url = params.get("url", "")
+            html = params.get("html", "")
+            if not isinstance(url, str) or not isinstance(html, str):
+                self.__replyError(400, "url、html字段必须为字符串")
+                return
+            if url == "" and html == "":
+                self.__replyError(400, "缺少url或html字段")
+                return
+            result = self.__extract(url, html, params)
+            if result is not None:
+                self.__reply(200, json.dumps({"title": result[0], "html": result[1]}, ensure_ascii = False),
+                    "application/json")
+
+
+        def log_message(self, format, *args):
+            sys.stderr.write("{} {}\n".format(self.address_string(), format % args))
+
+
+    class ExtractServer(http.server.HTTPServer):
+        ''' 正文提取服务，使用固定大小的线程池并发处理请求
+
+            所有请求共用模块已导入的内容、连接池及缓存对象，避免每次提取都启动新的进程。
+            options中的连接池应设置remoteOnly，使网页及图片只能从http、https地址抓取。
+        '''
+
+        def __init__(self, address, options, workers = 8):
+            ''' 参数说明：
+                    address     监听地址，(host, port)
+                    options     Article的参数（字典），不含html、url
+                    workers     处理请求的线程数
+            '''
+            super().__init__(address, ExtractHandler)
+            self.options = options
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
+
+
+        def process_request(self, request, client_address):
+            self.__executor.submit(self.__processRequest, request, client_address)
+
+
+        def __processRequest(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+        def server_close(self):
+            super().server_close()
+            self.__executor.shutdown(wait = False)
+
+
+def __getattr__(name):
+    ''' 按需定义依赖bs4或http.server的类，使htmlarticle.RawHtml、htmlarticle.ExtractServer等仍然可用 '''
+
+    if name == "RawHtml":
+        return _rawHtmlClass()
+    if name in ["ExtractHandler", "ExtractServer"]:
+        _defineServer()
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
-        return htmlstring
+
+def parseAddress(address):
+    ''' 将[host:]port格式的字符串转换为(host, port)，host默认为127.0.0.1，格式错误时抛出ValueError异常 '''
+
+    host, _, port = address.rpartition(":")
+    if host == "":
+        host = "127.0.0.1"
+    port = int(port)
+    if not 0 < port < 65536:
+        raise ValueError("端口号超出范围：{}".format(port))
+    return (host, port)
 
 
 # 默认的user agent
@@ -469,6 +3334,31 @@ if __name__ == '__main__':
     rows = 0
     chars = 0
     inline = False
+    imageWorkers = 0
+    imageCache = None
+    imageCacheDir = None
+    imageSize = None
+    imageQuality = None
+    imageFormat = None
+    httpCacheDir = None
+    httpCacheSize = 100
+    refresh = False
+    resultCacheDir = None
+    resultCacheSize = 100
+    hostConcurrency = 0
+    hostRate = 0
+    connectTimeout = 10
+    readTimeout = 30
+    retries = 2
+    hedgeDelay = 0
+    parser = None
+    engine = "lines"
+    maxPages = 1
+    pagePatterns = None
+    autoTune = False
+    sweep = False
+    stats = False
+    traceMemory = False
     withTitle = False
     withSource = False
     noCharsStat = False
@@ -477,11 +3367,22 @@ if __name__ == '__main__':
     autonaming = False
     htmlstring = ""
     url = ""
+    batch = None
+    outdir = "."
+    workers = 0
+    maxTasks = 50
+    serve = False
+    listen = "127.0.0.1:8000"
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "u:c:o:mitsnpah", 
-                [   "useragent=", "cookie=", "mobile", "rows=", "chars=", "inline", "title", 
-                    "source", "prettify", "output=", "autonaming", "help"])
+        opts, args = getopt.getopt(sys.argv[1:], "u:c:o:b:d:mitsnpah",
+                [   "useragent=", "cookie=", "mobile", "rows=", "chars=", "inline", "imageworkers=", "imagecache=",
+                    "imagesize=", "imagequality=", "imageformat=",
+                    "httpcache=", "httpcachesize=", "refresh", "resultcache=", "resultcachesize=",
+                    "hostconcurrency=", "hostrate=", "connecttimeout=", "readtimeout=", "retries=", "hedge=",
+                    "parser=", "engine=", "pages=", "pagepattern=", "autotune", "sweep", "stats", "tracememory",
+                    "title", "source", "prettify", "output=", "autonaming",
+                    "batch=", "outdir=", "workers=", "maxtasks=", "serve", "listen=", "help"])
 
         for i, j in opts:
             if i in ["-h", "--help"]:
@@ -512,6 +3413,130 @@ if __name__ == '__main__':
                     sys.exit(errstr)
             elif i in ["-i", "--inline"]:
                 inline = True
+            elif i == "--imageworkers":
+                errstr = "--imageworkers参数值只能为正整数"
+                try:
+                    imageWorkers = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if imageWorkers <= 0:
+                    sys.exit(errstr)
+            elif i == "--imagecache":
+                imageCacheDir = j
+                try:
+                    imageCache = ImageCache(j)
+                except OSError as e:
+                    sys.exit("无法使用图片缓存目录：{}".format(e))
+            elif i == "--imagesize":
+                try:
+                    imageSize = parseImageSize(j)
+                except ValueError:
+                    sys.exit("--imagesize参数值格式错误，应为<宽>x<高>或<宽>")
+            elif i == "--imagequality":
+                errstr = "--imagequality参数值只能为1-95的整数"
+                try:
+                    imageQuality = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if not 1 <= imageQuality <= 95:
+                    sys.exit(errstr)
+            elif i == "--imageformat":
+                imageFormat = j
+            elif i == "--httpcache":
+                httpCacheDir = j
+            elif i == "--httpcachesize":
+                errstr = "--httpcachesize参数值只能为正整数"
+                try:
+                    httpCacheSize = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if httpCacheSize <= 0:
+                    sys.exit(errstr)
+            elif i == "--refresh":
+                refresh = True
+            elif i == "--resultcache":
+                resultCacheDir = j
+            elif i == "--resultcachesize":
+                errstr = "--resultcachesize参数值只能为正整数"
+                try:
+                    resultCacheSize = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if resultCacheSize <= 0:
+                    sys.exit(errstr)
+            elif i == "--hostconcurrency":
+                errstr = "--hostconcurrency参数值只能为正整数"
+                try:
+                    hostConcurrency = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if hostConcurrency <= 0:
+                    sys.exit(errstr)
+            elif i == "--hostrate":
+                errstr = "--hostrate参数值只能为正数"
+                try:
+                    hostRate = float(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if not hostRate > 0:
+                    sys.exit(errstr)
+            elif i in ["--connecttimeout", "--readtimeout", "--hedge"]:
+                errstr = "{}参数值只能为正数".format(i)
+                try:
+                    n = float(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if not n > 0:
+                    sys.exit(errstr)
+                if i == "--connecttimeout":
+                    connectTimeout = n
+                elif i == "--readtimeout":
+                    readTimeout = n
+                else:
+                    hedgeDelay = n
+            elif i == "--retries":
+                errstr = "--retries参数值只能为非负整数"
+                try:
+                    retries = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if retries < 0:
+                    sys.exit(errstr)
+            elif i == "--parser":
+                try:
+                    parser = checkParser(j)
+                except ValueError as e:
+                    sys.exit(str(e))
+            elif i == "--engine":
+                if j not in engines:
+                    sys.exit("--engine参数值只能为{}".format("、".join(engines)))
+                engine = j
+            elif i == "--pages":
+                errstr = "--pages参数值只能为正整数"
+                try:
+                    maxPages = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if maxPages <= 0:
+                    sys.exit(errstr)
+            elif i == "--pagepattern":
+                try:
+                    if re.compile(j).groups < 1:
+                        sys.exit("--pagepattern参数值需要包含表示页码的分组：{}".format(j))
+                except re.error as e:
+                    sys.exit("--pagepattern参数值不是正确的正则表达式：{}".format(e))
+                if pagePatterns is None:
+                    pagePatterns = []
+                pagePatterns.append(j)
+            elif i == "--autotune":
+                autoTune = True
+            elif i == "--sweep":
+                sweep = True
+            elif i == "--stats":
+                stats = True
+            elif i == "--tracememory":
+                stats = True
+                traceMemory = True
             elif i in ["-t", "--title"]:
                 withTitle = True
             elif i in ["-s", "--source"]:
@@ -524,9 +3549,40 @@ if __name__ == '__main__':
                 output = j
             elif i in ["-a", "--autonaming"]:
                 autonaming = True
+            elif i in ["-b", "--batch"]:
+                batch = j
+            elif i in ["-d", "--outdir"]:
+                outdir = j
+            elif i == "--serve":
+                serve = True
+            elif i == "--listen":
+                listen = j
+            elif i in ["--workers", "--maxtasks"]:
+                errstr = "{}参数值只能为正整数".format(i)
+                try:
+                    n = int(j)
+                except ValueError:
+                    sys.exit(errstr)
+                if n <= 0:
+                    sys.exit(errstr)
+                if i == "--workers":
+                    workers = n
+                else:
+                    maxTasks = n
 
         if autonaming is True and output is not None:
             sys.exit("-o/--output参数与-a/--autonaming参数不能同时使用")
+
+        if autoTune and (rows > 0 or chars > 0):
+            sys.exit("--autotune参数与--rows、--chars参数不能同时使用")
+        if (autoTune or sweep) and (batch is not None or serve):
+            sys.exit("--autotune、--sweep参数不能与-b、--serve参数同时使用")
+        if stats and (batch is not None or serve):
+            sys.exit("--stats、--tracememory参数不能与-b、--serve参数同时使用")
+        if (autoTune or sweep) and engine != "lines":
+            sys.exit("--autotune、--sweep参数只能用于lines引擎")
+        if resultCacheDir is not None and maxPages > 1:
+            sys.exit("--resultcache参数不能与--pages参数同时使用")
         
         if output is not None:
             if os.path.isdir(output):
@@ -535,6 +3591,96 @@ if __name__ == '__main__':
         if useragent == "":
             useragent = defaultUseragent
 
+        imageProcessor = None
+        if imageSize is not None or imageQuality is not None or imageFormat is not None:
+            width, height = imageSize or (0, 0)
+            try:
+                imageProcessor = ImageProcessor(width, height, imageQuality or 85, imageFormat)
+            except ImportError:
+                sys.exit("--imagesize、--imagequality、--imageformat参数需要安装Pillow：pip install Pillow")
+            except ValueError as e:
+                sys.exit(str(e))
+
+        httpCache = None
+        if httpCacheDir is not None:
+            try:
+                httpCache = HttpCache(httpCacheDir, maxSize = httpCacheSize * 1024 * 1024, refresh = refresh)
+            except OSError as e:
+                sys.exit("无法使用网页缓存目录：{}".format(e))
+
+        resultCache = None
+        if resultCacheDir is not None:
+            try:
+                resultCache = ResultCache(resultCacheDir, maxSize = resultCacheSize * 1024 * 1024)
+            except OSError as e:
+                sys.exit("无法使用正文缓存目录：{}".format(e))
+
+        # 所有请求共用一个连接池，由HostScheduler限制对每个主机的请求
+        poolOptions = dict(connectTimeout = connectTimeout, readTimeout = readTimeout, retries = retries)
+        # 服务模式下url及图片地址来自客户端，只允许请求http、https地址
+        connectionPool = ConnectionPool(scheduler = HostScheduler(hostConcurrency, hostRate), remoteOnly = serve,
+            **poolOptions)
+
+        # 服务模式
+        if serve:
+            if batch is not None or output is not None or autonaming or len(args) > 0:
+                sys.exit("--serve参数不能与-b、-o、-a参数及url同时使用")
+            try:
+                address = parseAddress(listen)
+            except ValueError:
+                sys.exit("--listen参数值格式错误，应为[host:]port")
+            options = dict(rows = rows, chars = chars, useragent = useragent, cookie = cookie,
+                iimage = inline, noCharsStat = noCharsStat, withTitle = withTitle, withSource = withSource,
+                prettify = prettify, imageWorkers = imageWorkers, imageCache = imageCache,
+                httpCache = httpCache, parser = parser, imageProcessor = imageProcessor,
+                maxPages = maxPages, pagePatterns = pagePatterns, connectionPool = connectionPool,
+                hedgeDelay = hedgeDelay, resultCache = resultCache, engine = engine)
+            _defineServer()
+            try:
+                server = ExtractServer(address, options, workers if workers > 0 else 8)
+            except OSError as e:
+                sys.exit("无法监听地址{}：{}".format(listen, e.strerror))
+            print("正文提取服务已启动：http://{}:{}/".format(*address), file = sys.stderr)
+            try:
+                server.serve_forever()
+            finally:
+                server.server_close()
+            sys.exit()
+
+        # 批量处理模式
+        if batch is not None:
+            if output is not None or autonaming or len(args) > 0:
+                sys.exit("-b/--batch参数不能与-o、-a参数及url同时使用")
+            try:
+                if batch == "-":
+                    sources = readSources(sys.stdin)
+                else:
+                    with open(batch) as f:
+                        sources = readSources(f)
+            except IOError as e:
+                sys.exit("{}: {}".format(e.strerror, e.filename))
+
+            httpCacheOption = None
+            if httpCacheDir is not None:
+                httpCacheOption = (httpCacheDir, httpCacheSize * 1024 * 1024, refresh)
+            resultCacheOption = None
+            if resultCacheDir is not None:
+                resultCacheOption = (resultCacheDir, resultCacheSize * 1024 * 1024)
+            options = dict(rows = rows, chars = chars, useragent = useragent, cookie = cookie,
+                iimage = inline, noCharsStat = noCharsStat, withTitle = withTitle, withSource = withSource,
+                prettify = prettify, imageWorkers = imageWorkers, parser = parser,
+                imageCache = imageCacheDir, httpCache = httpCacheOption, imageProcessor = imageProcessor,
+                maxPages = maxPages, pagePatterns = pagePatterns, hostScheduler = (hostConcurrency, hostRate),
+                connectionPool = poolOptions, hedgeDelay = hedgeDelay, resultCache = resultCacheOption,
+                engine = engine)
+            try:
+                failed = runBatch(sources, outdir, options, workers, maxTasks)
+            except OSError as e:
+                sys.exit("{}: {}".format(e.strerror, e.filename))
+            if failed > 0:
+                sys.exit("{}个项目处理失败，详见{}".format(failed, os.path.join(outdir, "manifest.json")))
+            sys.exit()
+
         if len(args) > 0:
             url = args[0]
         else:
@@ -546,10 +3692,15 @@ if __name__ == '__main__':
 
         article = Article(html = htmlstring, url = url, rows = rows, chars = chars, 
                 useragent = useragent, cookie = cookie, iimage = inline, noCharsStat = noCharsStat, 
-                withTitle = withTitle, withSource = withSource, prettify = prettify)
+                withTitle = withTitle, withSource = withSource, prettify = prettify,
+                imageWorkers = imageWorkers, imageCache = imageCache, httpCache = httpCache, parser = parser,
+                traceMemory = traceMemory, imageProcessor = imageProcessor,
+                maxPages = maxPages, pagePatterns = pagePatterns, connectionPool = connectionPool,
+                hedgeDelay = hedgeDelay, resultCache = resultCache, engine = engine)
         
         # 从参数读取url，抓取网页
         if len(args) > 0:
+            import urllib.error
             errstr = "抓取网页时出错："
             try:
                 article.fetchPage()
@@ -559,7 +3710,34 @@ if __name__ == '__main__':
                 sys.exit("{}{}".format(errstr, e))
 
         article.preprocess()
-        outputHtml = article.article()
+        # 网页及分页已经抓取完毕
+        if httpCache is not None:
+            httpCache.flush()
+
+        if sweep:
+            # 每组参数输出一行json，只输出统计数据，不输出被选中的行的序号
+            for score in article.sweep():
+                del score["lines"]
+                print(json.dumps(score, ensure_ascii = False))
+            if stats:
+                print(article.stats().toJson(), file = sys.stderr)
+            sys.exit()
+
+        if autoTune:
+            best = article.autoTune(apply = True)
+            if best is not None:
+                print("自动选择的参数：--rows {} --chars {}".format(best["rows"], best["chars"]), file = sys.stderr)
+
+        # 分段输出，不在内存中生成包含所有图片的完整html
+        outputParts = article.articleParts()
+        if resultCache is not None:
+            resultCache.flush()
+
+        if stats:
+            print(article.stats().toJson(), file = sys.stderr)
+        for record in article.stats().failedFetches():
+            errstr = "未能嵌入图片" if record["type"] == "image" else "未能合并分页"
+            print("{}：{}（{}）".format(errstr, record["url"], record["error"]), file = sys.stderr)
 
         # 如果有-a参数，输出到文件（当前目录），文件名根据网页title生成
         if autonaming:
@@ -568,12 +3746,13 @@ if __name__ == '__main__':
         if output is not None:
             try:
                 with open(output, mode='wt') as f:
-                    f.write(outputHtml)
+                    f.writelines(outputParts)
                 print("生成文件：{}".format(output))
             except IOError as e:
                 sys.exit("{}: {}".format(e.strerror, e.filename))
         else:
-            print(outputHtml)
+            sys.stdout.writelines(outputParts)
+            sys.stdout.write("\n")
 
     except getopt.GetoptError:
         sys.exit("参数输入错误，使用参数-h查看帮助")
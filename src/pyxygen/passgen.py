@@ -9,7 +9,7 @@ Passgen
 
 更多 Pyxygen 程序请访问：https://github.com/m3ng9i/Pyxygen'''
 
-import random, sys, getopt
+import sys, getopt
 
 # 显示帮助信息
 def usage():
@@ -84,6 +84,8 @@ def randomChars(chars, length):
     if len(chars) == 0:
         return ""
 
+    # random模块只在生成密码时导入，-h等运行方式不加载
+    import random
     r = random.SystemRandom()
     n = 0
     s = ""
@@ -154,4 +156,5 @@ def main():
         print(randomChars(chars, length))
         number = number - 1
     
-main()
+if __name__ == '__main__':
+    main()